@@ -1,78 +1,414 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, has_request_context
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
+import asyncio
 import os
+import sys
+import json
 import requests
 from datetime import datetime
-import jwt
-from functools import wraps
+from sqlalchemy import func, insert, text, update
+from sqlalchemy.exc import IntegrityError
+from treatment_cache import TreatmentCache
+from outbox import OutboxDispatcher
+from availability import AvailabilityIndex, FREE_STATUSES
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.auth import auth_stats, service_token, token_required
+from common.bulk import BULK_CHUNK_SIZE, BulkError, bulk_summary, read_bulk_rows
+from common.db import configure_database
+from common.export import chunked, ndjson_response, wants_ndjson
+from common.idempotency import IdempotencyStore
+from common.instrumentation import init_instrumentation
+from common.migrations import ensure_columns, ensure_indexes
+from common.pagination import MAX_LIMIT, PaginationError, paginate, parse_date, parse_limit
+from common.rollups import add_delta, apply_deltas, rebuild_rollup
+from common.service_client import gather_chunks, get_client
 
 app = Flask(__name__)
 CORS(app)
 
 # Database configuration
 basedir = os.path.abspath(os.path.dirname(__file__))
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(basedir, 'appointment.db')
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['SECRET_KEY'] = 'your-secret-key'  # Change this in production
+configure_database(app, 'appointment', os.path.join(basedir, 'appointment.db'))
+app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'your-secret-key')  # Change this in production
+PORT = int(os.environ.get('PORT', 5003))
 
 db = SQLAlchemy(app)
+treatment_cache = TreatmentCache(
+    maxsize=int(os.environ.get('TREATMENT_CACHE_SIZE', 256)),
+    ttl=int(os.environ.get('TREATMENT_CACHE_TTL', 300)),
+    change_window=int(os.environ.get('TREATMENT_CHANGE_WINDOW', 60))
+)
+
+# Downstream services
+treatment_service = get_client(os.environ.get('TREATMENT_SERVICE_URL', 'http://localhost:5002'))
+payment_service = get_client(os.environ.get('PAYMENT_SERVICE_URL', 'http://localhost:5004'))
 
 # Models
 class Appointment(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.String(100), nullable=False)
     treatment_id = db.Column(db.Integer, nullable=False)
-    appointment_date = db.Column(db.String(10), nullable=False)
-    appointment_time = db.Column(db.String(5), nullable=False)
+    appointment_date = db.Column(db.Date, nullable=False)
+    appointment_time = db.Column(db.Time, nullable=False)
     status = db.Column(db.String(20), default='confirmed')  # Default to confirmed
     notes = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
-# Authentication decorator
-def token_required(f):
-    @wraps(f)
-    def decorated(*args, **kwargs):
-        token = None
-        if 'Authorization' in request.headers:
-            token = request.headers['Authorization'].split(" ")[1]
+    __table_args__ = (
+        db.Index('ix_appointment_created_at_id', 'created_at', 'id'),
+        db.Index('ix_appointment_user_date', 'user_id', 'appointment_date'),
+        db.Index('ix_appointment_date_time', 'appointment_date', 'appointment_time'),
+        db.Index('ix_appointment_treatment_slot', 'treatment_id', 'appointment_date', 'appointment_time'),
+    )
 
-        if not token:
-            return jsonify({'message': 'Token is missing!'}), 401
+# One row per (doctor, date). Booking bumps it first, which holds a row lock (the write
+# lock on SQLite) until commit, so worker processes book the same day one at a time.
+class SlotLock(db.Model):
+    doctor = db.Column(db.String(100), primary_key=True)
+    date = db.Column(db.Date, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
 
-        try:
-            data = jwt.decode(token, app.config['SECRET_KEY'], algorithms=["HS256"])
-            request.user_data = data
-        except jwt.ExpiredSignatureError:
-            return jsonify({'message': 'Token has expired!'}), 401
-        except jwt.InvalidTokenError:
-            return jsonify({'message': 'Token is invalid!'}), 401
+# Appointments per (appointment date, treatment, status) for GET /admin/appointments/summary,
+# updated in the same transaction as every booking change; `flask --app app
+# backfill-rollups` recomputes it
+class AppointmentRollup(db.Model):
+    day = db.Column(db.Date, primary_key=True)
+    treatment_id = db.Column(db.Integer, primary_key=True)
+    status = db.Column(db.String(20), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+def appointment_rollup_key(appointment_date, treatment_id, status):
+    return (appointment_date, treatment_id, status or 'confirmed')
+
+# Events waiting to be delivered to other services, written in the same transaction as the change
+class OutboxEvent(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    event_type = db.Column(db.String(50), nullable=False)
+    payload = db.Column(db.Text, nullable=False)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(db.Text)
+    next_attempt_at = db.Column(db.DateTime)  # lease while claimed, then retry time after a failed delivery
+    claimed_by = db.Column(db.String(32))  # dispatcher round holding the lease
+    dead_at = db.Column(db.DateTime)  # set once attempts ran out; `flask --app app replay-outbox` retries it
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    delivered_at = db.Column(db.DateTime, index=True)
+
+# Stored responses for Idempotency-Key retries (common/idempotency.py)
+class IdempotencyRecord(db.Model):
+    key = db.Column(db.String(255), primary_key=True)
+    fingerprint = db.Column(db.String(64), nullable=False)
+    status_code = db.Column(db.Integer)  # NULL while the first request is still running
+    body = db.Column(db.Text)
+    mimetype = db.Column(db.String(100))
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+idempotency = IdempotencyStore(db, IdempotencyRecord,
+                               ttl=int(os.environ.get('IDEMPOTENCY_TTL', 86400)),
+                               maxsize=int(os.environ.get('IDEMPOTENCY_CACHE_SIZE', 10000)))
+
+# Post a batch of outbox events to a payment service webhook, returns the ids that were accepted
+def post_events(path, events):
+    try:
+        response = payment_service.post(path, json=events,
+                                        headers={'Authorization': f'Bearer {service_token("appointment-service")}'},
+                                        idempotent=True)
+    except requests.RequestException as e:
+        print(f"Warning: Failed to deliver events to {path}: {e}")
+        return set()
+    if response.status_code not in (200, 201):
+        print(f"Warning: Failed to deliver events to {path}. Response: {response.text}")
+        return set()
+    failed = {e.get('event_id') for e in response.json().get('failed', [])}
+    return {e['event_id'] for e in events if e['event_id'] not in failed}
+
+# Confirmations create invoices; updates and deletions only refresh the payment
+# service's appointment projection. Confirmations go first, so a batch holding both
+# for the same appointment is applied in order.
+def deliver_appointment_events(events):
+    confirmed = [e for e in events if e['event_type'] == 'appointment.confirmed']
+    changed = [e for e in events if e['event_type'] != 'appointment.confirmed']
+    delivered = set()
+    if confirmed:
+        delivered |= post_events('/webhook/appointment-confirmed', confirmed)
+    if changed:
+        delivered |= post_events('/webhook/appointment-changed', changed)
+    return delivered
+
+outbox_dispatcher = OutboxDispatcher(app, db, OutboxEvent, deliver_appointment_events,
+                                     batch_size=int(os.environ.get('OUTBOX_BATCH_SIZE', 100)),
+                                     interval=float(os.environ.get('OUTBOX_INTERVAL', 1.0)),
+                                     max_attempts=int(os.environ.get('OUTBOX_MAX_ATTEMPTS', 20)),
+                                     max_delay=float(os.environ.get('OUTBOX_MAX_DELAY', 600)),
+                                     lease=float(os.environ.get('OUTBOX_LEASE', 60)))
+init_instrumentation(app, 'appointment', stats={'auth': auth_stats, 'treatment_cache': treatment_cache.stats,
+                                                'idempotency': idempotency.stats, 'outbox': outbox_dispatcher.stats})
+
+# Appointment dates and times arrive as 'YYYY-MM-DD' and 'HH:MM'
+def parse_appointment_date(value):
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+def parse_appointment_time(value):
+    return datetime.strptime(value, '%H:%M').time()
 
-        return f(*args, **kwargs)
-    return decorated
+# treatment_id arrives as a number or, from the booking page, as a string
+def parse_treatment_id(value):
+    return int(str(value))
+
+def format_time(value):
+    return value.strftime('%H:%M')
+
+# Forward the caller's token downstream; background work has no request to forward
+def forward_headers():
+    if has_request_context() and request.headers.get('Authorization'):
+        return {'Authorization': request.headers['Authorization']}
+    return {}
+
+# Treatment of a booking. Returns (treatment, error, status_code): 400 for an unknown
+# treatment, 503 when the treatment service can't be reached
+def resolve_treatment(treatment_id):
+    treatment = treatment_cache.get(treatment_id)
+    if treatment is not None:
+        return treatment, None, None
+    try:
+        response = treatment_service.get(f'/treatments/{treatment_id}',
+                                         headers=forward_headers())
+    except requests.RequestException:
+        return None, 'Treatment service unavailable, try again later', 503
+    if response.status_code == 404:
+        return None, 'Treatment not found', 400
+    if response.status_code != 200:
+        return None, 'Treatment service unavailable, try again later', 503
+    treatment = response.json()
+    treatment_cache.set(treatment_id, treatment)
+    return treatment, None, None
 
 # Helper function to get treatment details
 def get_treatment_details(treatment_id):
+    return resolve_treatment(treatment_id)[0]
+
+# Helper function to get many treatments in a single request, keyed by id
+def get_treatments_details(treatment_ids):
+    treatments, missing = treatment_cache.get_many(sorted(set(treatment_ids)))
+    if not missing:
+        return treatments
     try:
-        response = requests.get(f'http://localhost:5002/treatments/{treatment_id}', 
-                              headers={'Authorization': request.headers.get('Authorization')})
+        response = treatment_service.get('/treatments',
+                                         params={'ids': ','.join(str(i) for i in missing)},
+                                         headers=forward_headers())
         if response.status_code == 200:
-            return response.json()
+            for treatment in response.json():
+                treatment_cache.set(treatment['id'], treatment)
+                treatments[treatment['id']] = treatment
+        return treatments
+    except requests.RequestException:
+        return treatments
+
+# Async variant for asyncio.gather: cache misses are fetched in chunks of
+# FANOUT_CHUNK_SIZE ids, all chunks concurrently
+async def get_treatments_details_async(treatment_ids):
+    treatments, missing = treatment_cache.get_many(sorted(set(treatment_ids)))
+    if not missing:
+        return treatments
+    headers = forward_headers()
+
+    async def fetch(chunk):
+        try:
+            response = await treatment_service.aget('/treatments',
+                                                    params={'ids': ','.join(str(i) for i in chunk)},
+                                                    headers=headers)
+        except requests.RequestException:
+            return {}
+        if response.status_code != 200:
+            return {}
+        return {t['id']: t for t in response.json()}
+
+    for treatment_id, treatment in (await gather_chunks(fetch, missing)).items():
+        treatment_cache.set(treatment_id, treatment)
+        treatments[treatment_id] = treatment
+    return treatments
+
+# Helper function to get the payments of many appointments, keyed by appointment id;
+# None when the payment service could not be reached
+async def get_payments_for_appointments_async(appointment_ids, headers):
+    appointment_ids = sorted(set(appointment_ids))
+    if not appointment_ids:
+        return {}
+
+    async def fetch(chunk):
+        response = await payment_service.aget('/payments',
+                                              params={'appointment_ids': ','.join(str(i) for i in chunk)},
+                                              headers=headers)
+        if response.status_code != 200:
+            raise requests.RequestException(f'payment service returned {response.status_code}')
+        return {p['appointment_id']: p for p in response.json()}
+
+    try:
+        return await gather_chunks(fetch, appointment_ids)
+    except requests.RequestException:
         return None
-    except:
+
+# Slots are booked per doctor; if the treatment can't be resolved fall back to the treatment itself
+def slot_key(treatment_id, appointment_date, treatment=None):
+    doctor = treatment.get('nama_dokter') if treatment else None
+    return (doctor or f'treatment:{treatment_id}', appointment_date)
+
+# Upcoming booked slots for the availability index; complete is False if some doctor was unknown
+def load_booked_slots():
+    rows = (db.session.query(Appointment.id, Appointment.treatment_id,
+                             Appointment.appointment_date, Appointment.appointment_time)
+            .filter(Appointment.appointment_date >= datetime.utcnow().date(),
+                    Appointment.status.notin_(FREE_STATUSES))
+            .all())
+    treatments = get_treatments_details(row.treatment_id for row in rows)
+    slots = []
+    for row in rows:
+        start, end = availability.interval(row.appointment_time)
+        key = slot_key(row.treatment_id, row.appointment_date, treatments.get(row.treatment_id))
+        slots.append((row.id, key, start, end))
+    return slots, all(row.treatment_id in treatments for row in rows)
+
+# Every treatment in one cached call; None when the treatment service can't be reached
+def get_treatment_catalog():
+    catalog = treatment_cache.get_catalog()
+    if catalog is not None:
+        return catalog
+    try:
+        response = treatment_service.get('/treatments', headers=forward_headers())
+    except requests.RequestException:
+        return None
+    if response.status_code != 200:
         return None
+    catalog = response.json()
+    treatment_cache.set_catalog(catalog)
+    for treatment in catalog:
+        treatment_cache.set(treatment['id'], treatment)
+    return catalog
+
+# Treatments whose bookings share the calendar of a slot key, i.e. every treatment of the
+# doctor: those in the catalog plus those already booked that day, so a treatment added
+# after the catalog was cached still counts. Resolved before taking availability.lock,
+# so refreshing the day under the lock is a single indexed query.
+def slot_treatment_ids(key, treatment_id):
+    doctor, day = key
+    treatments = list(get_treatment_catalog() or [])  # fills the per-id cache for the lookup below
+    booked = db.session.scalars(db.select(Appointment.treatment_id).distinct()
+                                .where(Appointment.appointment_date == day,
+                                       Appointment.status.notin_(FREE_STATUSES))).all()
+    treatments.extend(get_treatments_details(booked).values())
+    return sorted({treatment_id} | {t['id'] for t in treatments if t.get('nama_dokter') == doctor})
+
+# Booked slots of one (doctor, date) straight from the database, through the
+# (treatment_id, appointment_date, appointment_time) index
+def load_day_slots(key, treatment_ids):
+    rows = (db.session.query(Appointment.id, Appointment.appointment_time)
+            .filter(Appointment.treatment_id.in_(treatment_ids), Appointment.appointment_date == key[1],
+                    Appointment.status.notin_(FREE_STATUSES))
+            .all())
+    return [(row.id, *availability.interval(row.appointment_time)) for row in rows]
+
+# Lock the day in the database for the rest of the transaction, then refresh it in the
+# index so bookings committed by other worker processes are part of the conflict check
+def lock_slot_day(key, treatment_ids):
+    doctor, day = key
+    bump = (update(SlotLock).where(SlotLock.doctor == doctor, SlotLock.date == day)
+            .values(version=SlotLock.version + 1))
+    if db.session.execute(bump).rowcount == 0:
+        try:
+            with db.session.begin_nested():
+                db.session.add(SlotLock(doctor=doctor, date=day, version=1))
+        except IntegrityError:
+            db.session.execute(bump)
+    availability.replace_day(key, load_day_slots(key, treatment_ids))
+
+availability = AvailabilityIndex(load_booked_slots,
+                                 slot_minutes=int(os.environ.get('SLOT_MINUTES', 60)),
+                                 open_time=os.environ.get('CLINIC_OPEN', '09:00'),
+                                 close_time=os.environ.get('CLINIC_CLOSE', '17:00'),
+                                 retry_interval=float(os.environ.get('AVAILABILITY_RETRY_INTERVAL', 30)))
+
+def outbox_row(event_type, payload):
+    return {
+        'event_type': event_type,
+        'payload': json.dumps(payload),
+        'attempts': 0,
+        'created_at': datetime.utcnow()
+    }
+
+# appointment.confirmed outbox row. The event carries a price snapshot so the
+# payment service needs no callbacks.
+def confirmed_event(appointment_id, values, treatment):
+    return outbox_row('appointment.confirmed', {
+        'appointment_id': appointment_id,
+        'user_id': values['user_id'],
+        'treatment_id': values['treatment_id'],
+        'treatment_name': treatment.get('nama'),
+        'price': treatment.get('harga'),
+        'appointment_date': values['appointment_date'].isoformat(),
+        'appointment_time': format_time(values['appointment_time'])
+    })
+
+# appointment.updated carries the appointment's current state; the treatment name
+# only when the lookup succeeded, so a treatment service outage doesn't blank it
+def updated_event(appointment, treatment):
+    payload = {
+        'appointment_id': appointment.id,
+        'user_id': appointment.user_id,
+        'treatment_id': appointment.treatment_id,
+        'appointment_date': appointment.appointment_date.isoformat(),
+        'appointment_time': format_time(appointment.appointment_time),
+        'status': appointment.status
+    }
+    if treatment:
+        payload['treatment_name'] = treatment.get('nama')
+    return outbox_row('appointment.updated', payload)
+
+def deleted_event(appointment_id):
+    return outbox_row('appointment.deleted', {'appointment_id': appointment_id})
 
 # Endpoints
 @app.route('/appointments', methods=['POST'])
 @token_required
+@idempotency.idempotent
 def create_appointment():
     data = request.get_json()
     required_fields = ['treatment_id', 'appointment_date', 'appointment_time']
     for field in required_fields:
         if field not in data:
             return jsonify({'message': f'{field} is required'}), 400
-    
+
+    try:
+        data['treatment_id'] = parse_treatment_id(data['treatment_id'])
+    except ValueError:
+        return jsonify({'message': 'treatment_id must be an integer'}), 400
+    try:
+        data['appointment_date'] = parse_appointment_date(data['appointment_date'])
+        data['appointment_time'] = parse_appointment_time(data['appointment_time'])
+    except (ValueError, TypeError):
+        return jsonify({'message': 'appointment_date must be YYYY-MM-DD and appointment_time HH:MM'}), 400
+
+    # The confirmed event carries the treatment's price, so the booking needs it now
+    treatment, error, status_code = resolve_treatment(data['treatment_id'])
+    if error:
+        return jsonify({'message': error}), status_code
+
+    start, end = availability.interval(data['appointment_time'])
+    key = slot_key(data['treatment_id'], data['appointment_date'], treatment)
+    treatment_ids = slot_treatment_ids(key, data['treatment_id'])
+    availability.ensure_loaded()
+
+    # Conflict check, insert and index update happen under one lock (and the day's
+    # database lock) so two requests can never both take the same slot
+    with availability.lock:
+        lock_slot_day(key, treatment_ids)
+        if availability.conflict(key, start, end) is not None:
+            db.session.rollback()
+            return jsonify({'message': 'This slot is already booked'}), 409
+        return insert_appointment(data, treatment, key, start, end)
+
+def insert_appointment(data, treatment, key, start, end):
     try:
         appointment = Appointment(
             user_id=data['user_id'],
@@ -83,18 +419,17 @@ def create_appointment():
             status='confirmed'  # Auto-confirmed
         )
         db.session.add(appointment)
-        db.session.commit()
+        db.session.flush()
+        apply_deltas(db.session, AppointmentRollup, {
+            appointment_rollup_key(appointment.appointment_date, appointment.treatment_id, appointment.status):
+                {'count': 1}
+        })
 
-        # Notify Payment Service to create invoice
-        webhook_data = {
-            'appointment_id': appointment.id,
-            'user_id': appointment.user_id
-        }
-        response = requests.post('http://localhost:5004/webhook/appointment-confirmed', 
-                               json=webhook_data, 
-                               headers={'Authorization': request.headers.get('Authorization')})
-        if response.status_code != 201:
-            print(f"Warning: Failed to create invoice. Response: {response.text}")
+        # Payment Service creates the invoice once the outbox dispatcher delivers this event
+        db.session.add(OutboxEvent(**confirmed_event(appointment.id, data, treatment)))
+        db.session.commit()
+        availability.add(appointment.id, key, start, end)
+        outbox_dispatcher.wake()
 
         return jsonify({
             'message': 'Appointment created successfully',
@@ -102,8 +437,8 @@ def create_appointment():
                 'id': appointment.id,
                 'user_id': appointment.user_id,
                 'treatment_id': appointment.treatment_id,
-                'appointment_date': appointment.appointment_date,
-                'appointment_time': appointment.appointment_time,
+                'appointment_date': appointment.appointment_date.isoformat(),
+                'appointment_time': format_time(appointment.appointment_time),
                 'status': appointment.status
             }
         }), 201
@@ -111,11 +446,136 @@ def create_appointment():
         db.session.rollback()
         return jsonify({'message': f'Error creating appointment: {str(e)}'}), 500
 
+APPOINTMENT_STATUSES = ('pending', 'confirmed', 'completed') + FREE_STATUSES
+
+def bulk_treatment_id(row):
+    try:
+        return parse_treatment_id(row['treatment_id']) if isinstance(row, dict) else None
+    except (KeyError, ValueError):
+        return None
+
+# Validate one bulk row and return the column values to insert; raises ValueError
+def bulk_appointment_values(row, treatments):
+    if not isinstance(row, dict):
+        raise ValueError('Row must be an object')
+    for field in ('user_id', 'treatment_id', 'appointment_date', 'appointment_time'):
+        if row.get(field) in (None, ''):
+            raise ValueError(f'{field} is required')
+    treatment_id = bulk_treatment_id(row)
+    if treatment_id is None:
+        raise ValueError('treatment_id must be an integer')
+    if treatment_id not in treatments:
+        raise ValueError(f'Unknown treatment_id {treatment_id}')
+    status = row.get('status') or 'confirmed'
+    if status not in APPOINTMENT_STATUSES:
+        raise ValueError(f"status must be one of {', '.join(APPOINTMENT_STATUSES)}")
+    try:
+        appointment_date = parse_appointment_date(row['appointment_date'])
+        appointment_time = parse_appointment_time(row['appointment_time'])
+        created_at = datetime.fromisoformat(row['created_at']) if row.get('created_at') else datetime.utcnow()
+    except (ValueError, TypeError):
+        raise ValueError('appointment_date must be YYYY-MM-DD, appointment_time HH:MM and created_at ISO 8601')
+    return {
+        'user_id': str(row['user_id']),
+        'treatment_id': treatment_id,
+        'appointment_date': appointment_date,
+        'appointment_time': appointment_time,
+        'status': status,
+        'notes': row.get('notes'),
+        'created_at': created_at,
+        'updated_at': created_at
+    }
+
+# Import many appointments (JSON array or NDJSON). Rows are validated up front and
+# inserted in chunked transactions; upcoming rows still go through the slot check.
+# ?invoices=false skips the appointment.confirmed events, e.g. when payments are
+# imported separately; otherwise the outbox delivers them to the payment service in batches.
+@app.route('/appointments/bulk', methods=['POST'])
+@token_required
+def bulk_create_appointments():
+    if request.user_data['role'] != 'admin':
+        return jsonify({'message': 'Unauthorized access'}), 403
+    try:
+        rows, errors = read_bulk_rows()
+    except BulkError as e:
+        return jsonify({'message': str(e)}), 400
+    create_invoices = request.args.get('invoices', 'true').lower() != 'false'
+
+    treatments = get_treatments_details(
+        treatment_id for treatment_id in (bulk_treatment_id(row) for _, row in rows) if treatment_id is not None
+    )
+    valid = []
+    for number, row in rows:
+        try:
+            valid.append((number, bulk_appointment_values(row, treatments)))
+        except ValueError as e:
+            errors.append({'row': number, 'error': str(e)})
+
+    today = datetime.utcnow().date()
+    inserted = 0
+    for chunk in chunked(valid, BULK_CHUNK_SIZE):
+        upcoming = {}
+        for _, values in chunk:
+            if values['appointment_date'] >= today and values['status'] not in FREE_STATUSES:
+                key = slot_key(values['treatment_id'], values['appointment_date'], treatments[values['treatment_id']])
+                if key not in upcoming:
+                    upcoming[key] = slot_treatment_ids(key, values['treatment_id'])
+        availability.ensure_loaded()
+        with availability.lock:
+            # Fixed order, so two bulk imports can't deadlock on each other's days
+            for key in sorted(upcoming):
+                lock_slot_day(key, upcoming[key])
+            accepted = []
+            for number, values in chunk:
+                slot = None
+                if values['appointment_date'] >= today and values['status'] not in FREE_STATUSES:
+                    treatment = treatments[values['treatment_id']]
+                    slot = (slot_key(values['treatment_id'], values['appointment_date'], treatment),
+                            *availability.interval(values['appointment_time']))
+                    if availability.conflict(*slot) is not None:
+                        errors.append({'row': number, 'error': 'This slot is already booked'})
+                        continue
+                    # Placeholder id until the real one is known, so rows in this chunk see each other
+                    availability.add(-number - 1, *slot)
+                accepted.append((number, values, slot))
+
+            deltas = {}
+            for _, values, _ in accepted:
+                add_delta(deltas, appointment_rollup_key(values['appointment_date'], values['treatment_id'],
+                                                         values['status']), count=1)
+            try:
+                ids = db.session.execute(
+                    insert(Appointment).returning(Appointment.id, sort_by_parameter_order=True),
+                    [values for _, values, _ in accepted]
+                ).scalars().all() if accepted else []
+                apply_deltas(db.session, AppointmentRollup, deltas)
+                if create_invoices and accepted:
+                    db.session.execute(insert(OutboxEvent), [
+                        confirmed_event(id, values, treatments[values['treatment_id']])
+                        for id, (_, values, _) in zip(ids, accepted)
+                    ])
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                ids = []
+                errors.extend({'row': number, 'error': f'Insert failed: {e}'} for number, _, _ in accepted)
+
+            for number, _, slot in accepted:
+                availability.remove(-number - 1)
+            for id, (_, _, slot) in zip(ids, accepted):
+                if slot:
+                    availability.add(id, *slot)
+            inserted += len(ids)
+
+    if create_invoices and inserted:
+        outbox_dispatcher.wake()
+    return jsonify(bulk_summary(inserted, errors)), 201 if inserted else 400
+
 @app.route('/appointments/<int:id>', methods=['GET'])
 @token_required
 def get_appointment(id):
     appointment = Appointment.query.get_or_404(id)
-    if appointment.user_id != request.user_data['user_id'] and request.user_data['role'] != 'admin':
+    if appointment.user_id != request.user_data['user_id'] and request.user_data['role'] not in ('admin', 'service'):
         return jsonify({'message': 'Unauthorized access'}), 403
     
     treatment = get_treatment_details(appointment.treatment_id)
@@ -123,8 +583,8 @@ def get_appointment(id):
         'id': appointment.id,
         'user_id': appointment.user_id,
         'treatment': treatment,
-        'appointment_date': appointment.appointment_date,
-        'appointment_time': appointment.appointment_time,
+        'appointment_date': appointment.appointment_date.isoformat(),
+        'appointment_time': format_time(appointment.appointment_time),
         'status': appointment.status,
         'notes': appointment.notes,
         'created_at': appointment.created_at.strftime('%Y-%m-%d %H:%M:%S')
@@ -140,32 +600,72 @@ def update_appointment(id):
     data = request.get_json()
     try:
         if 'appointment_date' in data:
-            appointment.appointment_date = data['appointment_date']
+            data['appointment_date'] = parse_appointment_date(data['appointment_date'])
         if 'appointment_time' in data:
-            appointment.appointment_time = data['appointment_time']
-        if 'status' in data:
-            appointment.status = data['status']
-        if 'notes' in data:
-            appointment.notes = data['notes']
-        appointment.updated_at = datetime.utcnow()
+            data['appointment_time'] = parse_appointment_time(data['appointment_time'])
+    except (ValueError, TypeError):
+        return jsonify({'message': 'appointment_date must be YYYY-MM-DD and appointment_time HH:MM'}), 400
 
-        db.session.commit()
+    start, end = availability.interval(data.get('appointment_time', appointment.appointment_time))
 
-        return jsonify({
-            'message': 'Appointment updated successfully',
-            'appointment': {
-                'id': appointment.id,
-                'user_id': appointment.user_id,
-                'treatment_id': appointment.treatment_id,
-                'appointment_date': appointment.appointment_date,
-                'appointment_time': appointment.appointment_time,
-                'status': appointment.status,
-                'notes': appointment.notes
-            }
-        })
-    except Exception as e:
-        db.session.rollback()
-        return jsonify({'message': f'Error updating appointment: {str(e)}'}), 500
+    frees_slot = data.get('status', appointment.status) in FREE_STATUSES
+    if frees_slot:
+        treatment = get_treatment_details(appointment.treatment_id)
+    else:
+        # Without the doctor the slot can't be checked against the right calendar
+        treatment, error, status_code = resolve_treatment(appointment.treatment_id)
+        if error:
+            return jsonify({'message': error}), status_code
+    key = slot_key(appointment.treatment_id, data.get('appointment_date', appointment.appointment_date), treatment)
+    treatment_ids = None if frees_slot else slot_treatment_ids(key, appointment.treatment_id)
+    availability.ensure_loaded()
+
+    with availability.lock:
+        if not frees_slot:
+            lock_slot_day(key, treatment_ids)
+            if availability.conflict(key, start, end, ignore_id=appointment.id) is not None:
+                db.session.rollback()
+                return jsonify({'message': 'This slot is already booked'}), 409
+        try:
+            deltas = {}
+            add_delta(deltas, appointment_rollup_key(appointment.appointment_date, appointment.treatment_id,
+                                                     appointment.status), count=-1)
+            if 'appointment_date' in data:
+                appointment.appointment_date = data['appointment_date']
+            if 'appointment_time' in data:
+                appointment.appointment_time = data['appointment_time']
+            if 'status' in data:
+                appointment.status = data['status']
+            if 'notes' in data:
+                appointment.notes = data['notes']
+            appointment.updated_at = datetime.utcnow()
+            add_delta(deltas, appointment_rollup_key(appointment.appointment_date, appointment.treatment_id,
+                                                     appointment.status), count=1)
+            apply_deltas(db.session, AppointmentRollup, deltas)
+            db.session.add(OutboxEvent(**updated_event(appointment, treatment)))
+
+            db.session.commit()
+            if frees_slot:
+                availability.remove(appointment.id)
+            else:
+                availability.add(appointment.id, key, start, end)
+            outbox_dispatcher.wake()
+
+            return jsonify({
+                'message': 'Appointment updated successfully',
+                'appointment': {
+                    'id': appointment.id,
+                    'user_id': appointment.user_id,
+                    'treatment_id': appointment.treatment_id,
+                    'appointment_date': appointment.appointment_date.isoformat(),
+                    'appointment_time': format_time(appointment.appointment_time),
+                    'status': appointment.status,
+                    'notes': appointment.notes
+                }
+            })
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({'message': f'Error updating appointment: {str(e)}'}), 500
 
 @app.route('/appointments/<int:id>', methods=['DELETE'])
 @token_required
@@ -176,35 +676,275 @@ def delete_appointment(id):
     
     try:
         db.session.delete(appointment)
+        apply_deltas(db.session, AppointmentRollup, {
+            appointment_rollup_key(appointment.appointment_date, appointment.treatment_id, appointment.status):
+                {'count': -1}
+        })
+        db.session.add(OutboxEvent(**deleted_event(id)))
         db.session.commit()
+        availability.remove(id)
+        outbox_dispatcher.wake()
         return jsonify({'message': 'Appointment deleted successfully'})
     except Exception as e:
         db.session.rollback()
         return jsonify({'message': f'Error deleting appointment: {str(e)}'}), 500
 
+def serialize_appointment(appointment, treatment):
+    return {
+        'id': appointment.id,
+        'user_id': appointment.user_id,
+        'treatment': treatment,
+        'appointment_date': appointment.appointment_date.isoformat(),
+        'appointment_time': format_time(appointment.appointment_time),
+        'status': appointment.status,
+        'notes': appointment.notes,
+        'created_at': appointment.created_at.strftime('%Y-%m-%d %H:%M:%S')
+    }
+
+# Resolve the treatments of a chunk of appointments with one batched lookup
+def serialize_appointments(appointments):
+    treatments = get_treatments_details(a.treatment_id for a in appointments)
+    return [serialize_appointment(a, treatments.get(a.treatment_id)) for a in appointments]
+
+async def serialize_appointments_async(appointments):
+    treatments = await get_treatments_details_async(a.treatment_id for a in appointments)
+    return [serialize_appointment(a, treatments.get(a.treatment_id)) for a in appointments]
+
+# GET /appointments?ids=1,2,3 fetches several appointments in one call (used by the payment
+# service); GET /appointments?from=&to= lists appointments in a date range, ordered by date
+# and time through the (user_id, appointment_date) / (appointment_date, appointment_time) indexes
+@app.route('/appointments', methods=['GET'])
+@token_required
+def get_appointments():
+    query = Appointment.query
+    if request.user_data['role'] not in ('admin', 'service'):
+        query = query.filter(Appointment.user_id == request.user_data['user_id'])
+
+    ids = request.args.get('ids')
+    if ids:
+        try:
+            id_list = [int(i) for i in ids.split(',') if i.strip()]
+        except ValueError:
+            return jsonify({'message': 'ids must be a comma separated list of integers'}), 400
+        return jsonify(serialize_appointments(query.filter(Appointment.id.in_(id_list)).all()))
+
+    try:
+        limit = parse_limit(request.args.get('limit'), default=MAX_LIMIT)
+        if request.args.get('from'):
+            query = query.filter(Appointment.appointment_date >= parse_date(request.args['from'], 'from').date())
+        if request.args.get('to'):
+            query = query.filter(Appointment.appointment_date <= parse_date(request.args['to'], 'to').date())
+    except PaginationError as e:
+        return jsonify({'message': str(e)}), 400
+
+    appointments = (query.order_by(Appointment.appointment_date, Appointment.appointment_time, Appointment.id)
+                    .limit(limit).all())
+    return jsonify(serialize_appointments(appointments))
+
+async def gather_booking_lookups(appointments, headers):
+    return await asyncio.gather(
+        get_treatments_details_async([a.treatment_id for a in appointments]),
+        get_payments_for_appointments_async([a.id for a in appointments], headers)
+    )
+
+# Everything the booking pages need in one response: the user's appointments with their
+# treatment and invoice embedded. Treatments and invoices are fetched concurrently, each
+# in batched calls, and the response carries an ETag for If-None-Match.
+@app.route('/appointments/booking-view', methods=['GET'])
+@token_required
+def get_booking_view():
+    user_id = request.user_data['user_id']
+    if request.user_data['role'] == 'admin' and request.args.get('user_id'):
+        user_id = request.args['user_id']
+
+    query = Appointment.query.filter(Appointment.user_id == user_id)
+    try:
+        if request.args.get('from'):
+            query = query.filter(Appointment.appointment_date >= parse_date(request.args['from'], 'from').date())
+        if request.args.get('to'):
+            query = query.filter(Appointment.appointment_date <= parse_date(request.args['to'], 'to').date())
+    except PaginationError as e:
+        return jsonify({'message': str(e)}), 400
+    appointments = (query.order_by(Appointment.appointment_date, Appointment.appointment_time, Appointment.id)
+                    .limit(MAX_LIMIT).all())
+
+    treatments, payments = asyncio.run(gather_booking_lookups(appointments, forward_headers()))
+
+    result = []
+    for appointment in appointments:
+        item = serialize_appointment(appointment, treatments.get(appointment.treatment_id))
+        item['invoice'] = payments.get(appointment.id) if payments is not None else None
+        result.append(item)
+
+    response = jsonify({'appointments': result, 'invoices_available': payments is not None})
+    response.add_etag()
+    return response.make_conditional(request)
+
 @app.route('/admin/appointments', methods=['GET'])
 @token_required
 def get_all_appointments():
     if request.user_data['role'] != 'admin':
         return jsonify({'message': 'Unauthorized access'}), 403
-    
-    appointments = Appointment.query.all()
-    result = []
-    for appointment in appointments:
-        treatment = get_treatment_details(appointment.treatment_id)
-        result.append({
-            'id': appointment.id,
-            'user_id': appointment.user_id,
-            'treatment': treatment,
-            'appointment_date': appointment.appointment_date,
-            'appointment_time': appointment.appointment_time,
-            'status': appointment.status,
-            'notes': appointment.notes,
-            'created_at': appointment.created_at.strftime('%Y-%m-%d %H:%M:%S')
-        })
-    return jsonify(result)
 
-if __name__ == '__main__':
+    query = Appointment.query
+    try:
+        limit = parse_limit(request.args.get('limit'))
+        if request.args.get('status'):
+            query = query.filter(Appointment.status == request.args['status'])
+        if request.args.get('from'):
+            query = query.filter(Appointment.appointment_date >= parse_date(request.args['from'], 'from').date())
+        if request.args.get('to'):
+            query = query.filter(Appointment.appointment_date <= parse_date(request.args['to'], 'to').date())
+        if wants_ndjson():
+            return ndjson_response(query.order_by(Appointment.created_at, Appointment.id), serialize_appointments)
+        appointments, next_cursor = paginate(query, Appointment, request.args.get('cursor'), limit)
+    except PaginationError as e:
+        return jsonify({'message': str(e)}), 400
+
+    return jsonify({'appointments': asyncio.run(serialize_appointments_async(appointments)), 'next_cursor': next_cursor})
+
+# Booking counts per day, treatment and status from the rollup, plus per doctor, so the
+# cost depends on the number of days asked for rather than the number of appointments
+@app.route('/admin/appointments/summary', methods=['GET'])
+@token_required
+def get_appointment_summary():
+    if request.user_data['role'] != 'admin':
+        return jsonify({'message': 'Unauthorized access'}), 403
+
+    query = AppointmentRollup.query.filter(AppointmentRollup.count != 0)  # buckets emptied by moves and deletions stay behind
+    try:
+        if request.args.get('from'):
+            query = query.filter(AppointmentRollup.day >= parse_date(request.args['from'], 'from').date())
+        if request.args.get('to'):
+            query = query.filter(AppointmentRollup.day <= parse_date(request.args['to'], 'to').date())
+    except PaginationError as e:
+        return jsonify({'message': str(e)}), 400
+    treatment_id = request.args.get('treatment_id', type=int)
+    if treatment_id is not None:
+        query = query.filter(AppointmentRollup.treatment_id == treatment_id)
+    if request.args.get('status'):
+        query = query.filter(AppointmentRollup.status == request.args['status'])
+
+    rows = query.order_by(AppointmentRollup.day, AppointmentRollup.treatment_id, AppointmentRollup.status).all()
+    treatments = get_treatments_details(row.treatment_id for row in rows)
+    doctors = {}
+    for row in rows:
+        doctor = (treatments.get(row.treatment_id) or {}).get('nama_dokter') or f'treatment:{row.treatment_id}'
+        counts = doctors.setdefault(doctor, {})
+        counts[row.status] = counts.get(row.status, 0) + row.count
+    return jsonify({
+        'days': [{
+            'date': row.day.isoformat(),
+            'treatment_id': row.treatment_id,
+            'status': row.status,
+            'count': row.count
+        } for row in rows],
+        'doctors': doctors
+    })
+
+# Booked and free slots of the treatment's doctor on a given day
+@app.route('/availability', methods=['GET'])
+def get_availability():
+    treatment_id = request.args.get('treatment_id', type=int)
+    if not treatment_id or not request.args.get('date'):
+        return jsonify({'message': 'treatment_id and date are required'}), 400
+    try:
+        date = parse_appointment_date(request.args['date'])
+    except ValueError:
+        return jsonify({'message': 'date must be in YYYY-MM-DD format'}), 400
+
+    treatment, error, status_code = resolve_treatment(treatment_id)
+    if error:
+        return jsonify({'message': error}), 404 if status_code == 400 else status_code
+
+    key = slot_key(treatment_id, date, treatment)
+    availability.ensure_loaded()
+    availability.replace_day(key, load_day_slots(key, slot_treatment_ids(key, treatment_id)))
+    return jsonify({
+        'treatment_id': treatment_id,
+        'doctor': treatment.get('nama_dokter'),
+        'date': date.isoformat(),
+        'slot_minutes': availability.slot_minutes,
+        'booked': [{'start': start, 'end': end} for start, end in availability.booked(key)],
+        'available': availability.free(key)
+    })
+
+# Called by the treatment service whenever a treatment is added, updated or deleted, with
+# the new row (None once deleted); no treatment_id clears the whole cache
+@app.route('/internal/treatment-cache/invalidate', methods=['POST'])
+@token_required
+def invalidate_treatment_cache():
+    if request.user_data['role'] != 'service':
+        return jsonify({'message': 'Unauthorized access'}), 403
+
+    data = request.get_json(silent=True) or {}
+    try:
+        if data.get('treatment_id') is None:
+            treatment_cache.invalidate()
+        else:
+            treatment_cache.apply_change(data['treatment_id'], data.get('treatment'))
+    except (ValueError, TypeError):
+        return jsonify({'message': 'treatment_id must be an integer'}), 400
+    return jsonify({'message': 'Treatment cache invalidated'})
+
+@app.route('/internal/treatment-cache/stats', methods=['GET'])
+@token_required
+def treatment_cache_stats():
+    if request.user_data['role'] != 'service':
+        return jsonify({'message': 'Unauthorized access'}), 403
+    return jsonify(treatment_cache.stats())
+
+# Older databases stored appointment_time as 'HH:MM' strings; the Time column type
+# expects 'HH:MM:SS.ffffff' on SQLite. Dates were already stored as 'YYYY-MM-DD'.
+def migrate_appointment_datetimes():
+    if db.engine.dialect.name != 'sqlite':
+        return
+    with db.engine.begin() as conn:
+        conn.execute(text(
+            "UPDATE appointment SET appointment_time = appointment_time || :seconds "
+            "WHERE length(appointment_time) = 5"
+        ), {'seconds': ':00.000000'})
+        invalid = conn.execute(text(
+            "SELECT count(*) FROM appointment "
+            "WHERE appointment_date NOT GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]'"
+        )).scalar()
+    if invalid:
+        print(f"Warning: {invalid} appointments have a date that is not in YYYY-MM-DD format")
+
+# One-shot schema setup: `flask --app app init-db`
+@app.cli.command('init-db')
+def init_db_command():
+    db.create_all()
+    migrate_appointment_datetimes()
+    ensure_columns(db.engine, db.metadata)
+    ensure_indexes(db.engine, db.metadata)
+    print('Appointment database initialized')
+
+# Queue dead outbox events again, e.g. after a payment service outage: `flask --app app replay-outbox`
+@app.cli.command('replay-outbox')
+def replay_outbox_command():
+    replayed = outbox_dispatcher.replay_dead()
+    print(f'Outbox events queued for redelivery: {replayed}')
+
+# Recompute the booking rollup from the appointment table: `flask --app app backfill-rollups`
+@app.cli.command('backfill-rollups')
+def backfill_rollups_command():
+    status = func.coalesce(Appointment.status, 'confirmed')
+    grouped = (db.select(Appointment.appointment_date, Appointment.treatment_id, status, func.count())
+               .group_by(Appointment.appointment_date, Appointment.treatment_id, status))
+    buckets = rebuild_rollup(db.session, AppointmentRollup, ['day', 'treatment_id', 'status', 'count'], grouped)
+    print(f'Appointment rollup backfilled: {buckets} buckets')
+
+# Per-process setup for a serving process (wsgi.py, asgi.py or the dev server)
+def create_app():
     with app.app_context():
-        db.create_all()
-    app.run(debug=True, port=5003)
\ No newline at end of file
+        availability.rebuild()
+    outbox_dispatcher.start()
+    return app
+
+if __name__ == '__main__':
+    # Development server; production runs `gunicorn wsgi:application` (gunicorn.conf.py).
+    # With the reloader on, only the child process that serves requests is set up.
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        create_app()
+    app.run(debug=True, port=PORT)
@@ -0,0 +1,119 @@
+import threading
+import time
+from bisect import bisect_left, insort
+
+FREE_STATUSES = ('cancelled', 'canceled')
+
+
+def to_minutes(hhmm):
+    hours, minutes = hhmm.split(':')
+    hours, minutes = int(hours), int(minutes)
+    if not (0 <= hours < 24 and 0 <= minutes < 60):
+        raise ValueError(f'Invalid time {hhmm}')
+    return hours * 60 + minutes
+
+
+def to_hhmm(minutes):
+    return f'{minutes // 60:02d}:{minutes % 60:02d}'
+
+
+# In-memory index of booked slots per (doctor, date). Each day holds a sorted list of
+# non-overlapping (start, end, appointment_id) intervals, so a conflict check is a
+# single bisect. Callers hold `lock` around check + reserve + commit to make booking atomic
+# within the process; across processes the caller also locks the day in the database.
+# Every conflict check refreshes its day from the database first, so the full rebuild
+# only warms the index and runs outside `lock`.
+class AvailabilityIndex:
+    def __init__(self, loader, slot_minutes=60, open_time='09:00', close_time='17:00', retry_interval=30):
+        self.loader = loader  # callable() -> (iterable of (appointment_id, key, start, end), complete)
+        self.slot_minutes = slot_minutes
+        self.open_minutes = to_minutes(open_time)
+        self.close_minutes = to_minutes(close_time)
+        self.retry_interval = retry_interval
+        self.lock = threading.RLock()
+        self.loaded = False
+        self._days = {}  # (doctor, date) -> sorted list of (start, end, appointment_id)
+        self._appointments = {}  # appointment_id -> ((doctor, date), start, end)
+        self._rebuilding = threading.Lock()
+        self._next_retry = 0.0
+
+    def rebuild(self):
+        rows, complete = self.loader()
+        days, appointments = {}, {}
+        for appointment_id, key, start, end in rows:
+            insort(days.setdefault(key, []), (start, end, appointment_id))
+            appointments[appointment_id] = (key, start, end)
+        with self.lock:
+            self._days = days
+            self._appointments = appointments
+            self.loaded = complete
+        return len(appointments)
+
+    def ensure_loaded(self):
+        # Retried lazily when the startup rebuild could not resolve every doctor: by one
+        # caller at a time and at most once per retry_interval, so a treatment service
+        # outage doesn't turn every booking into a full rebuild
+        if self.loaded or time.monotonic() < self._next_retry:
+            return
+        if not self._rebuilding.acquire(blocking=False):
+            return
+        try:
+            self._next_retry = time.monotonic() + self.retry_interval
+            self.rebuild()
+        finally:
+            self._rebuilding.release()
+
+    def interval(self, start_time):
+        start = start_time.hour * 60 + start_time.minute
+        return start, start + self.slot_minutes
+
+    def conflict(self, key, start, end, ignore_id=None):
+        slots = self._days.get(key, [])
+        i = bisect_left(slots, (end,))
+        # Only the last interval starting before `end` can overlap, skipping the one being moved
+        while i > 0:
+            i -= 1
+            other_start, other_end, other_id = slots[i]
+            if other_id == ignore_id:
+                continue
+            return other_id if other_end > start else None
+        return None
+
+    def add(self, appointment_id, key, start, end):
+        with self.lock:
+            self.remove(appointment_id)
+            insort(self._days.setdefault(key, []), (start, end, appointment_id))
+            self._appointments[appointment_id] = (key, start, end)
+
+    def remove(self, appointment_id):
+        with self.lock:
+            entry = self._appointments.pop(appointment_id, None)
+            if entry is None:
+                return
+            key, start, end = entry
+            slots = self._days[key]
+            del slots[bisect_left(slots, (start, end, appointment_id))]
+            if not slots:
+                del self._days[key]
+
+    # Replace one day's bookings, e.g. with a fresh read from the database that also
+    # holds bookings made by other worker processes
+    def replace_day(self, key, slots):
+        with self.lock:
+            for _, _, appointment_id in list(self._days.get(key, [])):
+                self.remove(appointment_id)
+            for appointment_id, start, end in slots:
+                self.add(appointment_id, key, start, end)
+
+    def booked(self, key):
+        with self.lock:
+            return [(to_hhmm(start), to_hhmm(end)) for start, end, _ in self._days.get(key, [])]
+
+    def free(self, key):
+        with self.lock:
+            free = []
+            for start in range(self.open_minutes, self.close_minutes, self.slot_minutes):
+                end = start + self.slot_minutes
+                if end <= self.close_minutes and self.conflict(key, start, end) is None:
+                    free.append(to_hhmm(start))
+            return free
@@ -0,0 +1,132 @@
+import json
+import random
+import threading
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import or_, update
+
+
+# Background worker that drains the transactional outbox table.
+# Events are delivered at least once; receivers must handle duplicates.
+# A failed event is retried after an exponential backoff (base_delay doubling up to
+# max_delay, with jitter). After max_attempts it is marked dead and left alone until
+# `flask --app app replay-outbox` puts it back in the queue.
+# Every serving process runs a dispatcher. Each round first claims its batch by leasing
+# the rows (claimed_by plus next_attempt_at = now + lease), so only one process sends
+# an event; a lease left by a crashed process simply runs out.
+class OutboxDispatcher:
+    def __init__(self, app, db, model, deliver, batch_size=100, interval=1.0, max_attempts=20,
+                 base_delay=1.0, max_delay=600.0, lease=60.0):
+        self.app = app
+        self.db = db
+        self.model = model
+        self.deliver = deliver  # callable(list of event dicts) -> set of delivered event ids
+        self.batch_size = batch_size
+        self.interval = interval
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.lease = lease  # well above a delivery's worst case (timeouts times retries)
+        self.delivered = 0
+        self.retried = 0
+        self.dead = 0
+        self._stats_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='outbox-dispatcher', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wakeup.set()
+
+    def wake(self):
+        # Called after a commit so new events go out without waiting a full interval
+        self._wakeup.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                with self.app.app_context():
+                    while self.dispatch_once() == self.batch_size:
+                        pass
+            except Exception as e:
+                print(f"Warning: Outbox dispatch failed: {e}")
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+
+    def backoff(self, attempts):
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempts - 1))
+        return timedelta(seconds=delay * random.uniform(0.5, 1.0))
+
+    # Lease up to batch_size due events to this process and return them. The UPDATE
+    # repeats the due check, so of two processes picking the same ids only one gets each row.
+    def claim(self):
+        now = datetime.utcnow()
+        model = self.model
+        due = (model.delivered_at.is_(None), model.dead_at.is_(None),
+               or_(model.next_attempt_at.is_(None), model.next_attempt_at <= now))
+        ids = self.db.session.scalars(self.db.select(model.id).where(*due)
+                                      .order_by(model.id).limit(self.batch_size)).all()
+        if not ids:
+            self.db.session.rollback()
+            return []
+        token = uuid.uuid4().hex
+        self.db.session.execute(update(model).where(model.id.in_(ids), *due)
+                                .values(claimed_by=token, next_attempt_at=now + timedelta(seconds=self.lease)))
+        self.db.session.commit()
+        return model.query.filter(model.id.in_(ids), model.claimed_by == token).order_by(model.id).all()
+
+    def dispatch_once(self):
+        events = self.claim()
+        if not events:
+            return 0
+
+        payloads = [dict(json.loads(e.payload), event_id=e.id, event_type=e.event_type) for e in events]
+        try:
+            delivered = self.deliver(payloads)
+            error = None
+        except Exception as e:
+            delivered = set()
+            error = str(e)
+
+        now = datetime.utcnow()
+        dead = 0
+        for event in events:
+            event.claimed_by = None
+            if event.id in delivered:
+                event.delivered_at = now
+                continue
+            event.attempts += 1
+            event.last_error = error or 'Delivery rejected'
+            if event.attempts >= self.max_attempts:
+                event.dead_at = now
+                dead += 1
+                print(f"Warning: Outbox event {event.id} dead after {event.attempts} attempts: {event.last_error}")
+            else:
+                event.next_attempt_at = now + self.backoff(event.attempts)
+        self.db.session.commit()
+        with self._stats_lock:
+            self.delivered += len(delivered)
+            self.retried += len(events) - len(delivered) - dead
+            self.dead += dead
+        # A partial failure ends this round; the failed events wait out their backoff
+        return len(events) if len(delivered) == len(events) else 0
+
+    # Put dead events back in the queue with a fresh attempt budget, returns how many
+    def replay_dead(self):
+        model = self.model
+        replayed = (model.query.filter(model.delivered_at.is_(None), model.dead_at.isnot(None))
+                    .update({'dead_at': None, 'attempts': 0, 'next_attempt_at': None, 'claimed_by': None},
+                            synchronize_session=False))
+        self.db.session.commit()
+        return replayed
+
+    def stats(self):
+        with self._stats_lock:
+            return {'delivered': self.delivered, 'retried': self.retried, 'dead': self.dead}
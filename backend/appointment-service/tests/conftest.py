@@ -0,0 +1,56 @@
+import os
+import sys
+
+import jwt
+import pytest
+import requests
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TREATMENTS = [
+    {'id': 1, 'nama': 'Facial Glow Up', 'nama_dokter': 'dr. Ayu Pratiwi', 'harga': 150000},
+    {'id': 2, 'nama': 'Chemical Peeling', 'nama_dokter': 'dr. Ayu Pratiwi', 'harga': 200000},
+    {'id': 3, 'nama': 'Microneedling', 'nama_dokter': 'dr. Budi Santoso', 'harga': 300000},
+]
+
+
+class FakeResponse:
+    def __init__(self, status_code, body):
+        self.status_code = status_code
+        self._body = body
+
+    def json(self):
+        return self._body
+
+
+# Stands in for the treatment service client; no network calls are made
+class FakeTreatmentService:
+    available = True
+
+    def get(self, path, params=None, **kwargs):
+        if not self.available:
+            raise requests.ConnectionError('treatment service is down')
+        by_id = {t['id']: t for t in TREATMENTS}
+        if path == '/treatments':
+            if params and params.get('ids'):
+                return FakeResponse(200, [by_id[int(i)] for i in params['ids'].split(',') if int(i) in by_id])
+            return FakeResponse(200, list(TREATMENTS))
+        treatment = by_id.get(int(path.rsplit('/', 1)[1]))
+        return FakeResponse(200, treatment) if treatment else FakeResponse(404, {})
+
+
+@pytest.fixture(scope='session')
+def service(tmp_path_factory):
+    os.environ['APPOINTMENT_DATABASE_URL'] = 'sqlite:///' + str(tmp_path_factory.mktemp('db') / 'appointment.db')
+    sys.path.insert(0, SERVICE_DIR)
+    import app as service
+    service.treatment_service = FakeTreatmentService()
+    with service.app.app_context():
+        service.db.create_all()
+        service.availability.rebuild()
+    yield service
+    sys.path.remove(SERVICE_DIR)
+
+
+def auth_header(service, user_id):
+    token = jwt.encode({'user_id': user_id, 'role': 'pasien'}, service.app.config['SECRET_KEY'], algorithm='HS256')
+    return {'Authorization': f'Bearer {token}'}
@@ -0,0 +1,58 @@
+from datetime import date, timedelta
+
+import jwt
+
+from conftest import TREATMENTS, auth_header
+
+
+def booking(treatment_id, days_ahead, time='09:00'):
+    day = (date.today() + timedelta(days=days_ahead)).isoformat()
+    return {'user_id': 'patient', 'treatment_id': treatment_id, 'appointment_date': day, 'appointment_time': time}
+
+
+def test_unknown_treatment_is_rejected(service):
+    response = service.app.test_client().post('/appointments', json=booking(99, 50),
+                                              headers=auth_header(service, 'patient'))
+
+    assert response.status_code == 400
+
+
+def test_booking_waits_for_the_treatment_service(service):
+    service.treatment_cache.invalidate()
+    service.treatment_service.available = False
+    try:
+        response = service.app.test_client().post('/appointments', json=booking(3, 51),
+                                                  headers=auth_header(service, 'patient'))
+    finally:
+        service.treatment_service.available = True
+
+    assert response.status_code == 503
+
+
+def test_treatment_missing_from_the_cached_catalog_still_blocks_the_doctor(service):
+    client = service.app.test_client()
+    service.treatment_cache.invalidate()
+    with service.app.test_request_context():
+        service.get_treatment_catalog()
+    TREATMENTS.append({'id': 4, 'nama': 'Laser Rejuvenation', 'nama_dokter': 'dr. Ayu Pratiwi', 'harga': 500000})
+    try:
+        first = client.post('/appointments', json=booking(4, 52, '10:00'), headers=auth_header(service, 'patient'))
+        second = client.post('/appointments', json=booking(1, 52, '10:00'), headers=auth_header(service, 'other'))
+    finally:
+        TREATMENTS.pop()
+        service.treatment_cache.invalidate()
+
+    assert (first.status_code, second.status_code) == (201, 409)
+
+
+def test_bulk_import_coerces_treatment_ids_and_validates_status(service):
+    rows = [booking('1', 60), booking(3, 60, '11:00'), dict(booking(3, 60, '12:00'), status='bogus')]
+    token = jwt.encode({'user_id': 'admin', 'role': 'admin'}, service.app.config['SECRET_KEY'], algorithm='HS256')
+
+    response = service.app.test_client().post('/appointments/bulk?invoices=false', json=rows,
+                                              headers={'Authorization': f'Bearer {token}'})
+
+    body = response.get_json()
+    assert response.status_code == 201
+    assert body['inserted'] == 2
+    assert [e['row'] for e in body['errors']] == [2]
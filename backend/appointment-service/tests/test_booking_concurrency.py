@@ -0,0 +1,40 @@
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+from conftest import auth_header
+
+PARALLEL = 20
+
+
+def book_in_parallel(service, payloads):
+    start = threading.Barrier(len(payloads))
+
+    def book(i):
+        client = service.app.test_client()
+        start.wait()
+        response = client.post('/appointments', json=payloads[i], headers=auth_header(service, f'user-{i}'))
+        return response.status_code
+
+    with ThreadPoolExecutor(max_workers=len(payloads)) as pool:
+        return Counter(pool.map(book, range(len(payloads))))
+
+
+def test_parallel_bookings_for_one_slot_book_it_once(service):
+    day = (date.today() + timedelta(days=30)).isoformat()
+    payload = {'user_id': 'patient', 'treatment_id': 1, 'appointment_date': day, 'appointment_time': '10:00'}
+
+    statuses = book_in_parallel(service, [payload] * PARALLEL)
+
+    assert statuses == {201: 1, 409: PARALLEL - 1}
+
+
+def test_treatments_of_the_same_doctor_share_the_slot(service):
+    day = (date.today() + timedelta(days=31)).isoformat()
+    payloads = [{'user_id': 'patient', 'treatment_id': 1 + i % 2, 'appointment_date': day, 'appointment_time': '11:00'}
+                for i in range(PARALLEL)]
+
+    statuses = book_in_parallel(service, payloads)
+
+    assert statuses == {201: 1, 409: PARALLEL - 1}
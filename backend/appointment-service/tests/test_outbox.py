@@ -0,0 +1,52 @@
+import threading
+from collections import Counter
+
+
+def test_dispatchers_in_several_workers_send_each_event_once(service):
+    sent = Counter()
+    lock = threading.Lock()
+
+    def deliver(events):
+        with lock:
+            sent.update(e['event_id'] for e in events)
+        return {e['event_id'] for e in events}
+
+    with service.app.app_context():
+        service.db.session.execute(service.db.insert(service.OutboxEvent), [
+            service.outbox_row('appointment.deleted', {'appointment_id': i}) for i in range(300)
+        ])
+        service.db.session.commit()
+    dispatchers = [service.OutboxDispatcher(service.app, service.db, service.OutboxEvent, deliver, batch_size=25)
+                   for _ in range(4)]
+
+    def drain(dispatcher):
+        with service.app.app_context():
+            for _ in range(20):
+                dispatcher.dispatch_once()
+
+    threads = [threading.Thread(target=drain, args=(d,)) for d in dispatchers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    with service.app.app_context():
+        pending = service.OutboxEvent.query.filter(service.OutboxEvent.delivered_at.is_(None)).count()
+    assert pending == 0
+    assert set(sent.values()) == {1}
+
+
+def test_failed_delivery_backs_off_and_dead_letters(service):
+    def fail(events):
+        raise RuntimeError('payment service down')
+
+    with service.app.app_context():
+        service.db.session.add(service.OutboxEvent(**service.outbox_row('appointment.deleted', {'appointment_id': 1})))
+        service.db.session.commit()
+        dispatcher = service.OutboxDispatcher(service.app, service.db, service.OutboxEvent, fail,
+                                      max_attempts=2, base_delay=0)
+        dispatcher.dispatch_once()
+        dispatcher.dispatch_once()
+        dead = service.OutboxEvent.query.filter(service.OutboxEvent.dead_at.isnot(None)).count()
+        assert dead == 1
+        assert dispatcher.replay_dead() == 1
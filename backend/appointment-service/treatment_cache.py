@@ -0,0 +1,129 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+# Bounded TTL + LRU cache for treatment rows fetched from the treatment service.
+# Keys are coerced to int, so '1' from a JSON body and 1 from an invalidation match.
+# Changes published by the treatment service are stored as they are and, for
+# change_window seconds, also win over rows fetched afterwards: another treatment
+# service worker may still serve its older catalog snapshot for up to CATALOG_MAX_AGE.
+class TreatmentCache:
+    def __init__(self, maxsize=256, ttl=300, change_window=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.change_window = change_window
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()  # treatment_id -> (expires_at, treatment)
+        self._catalog = None  # (expires_at, list of every treatment)
+        self._changes = {}  # treatment_id -> (until, published treatment or None once deleted)
+        self._lock = threading.Lock()
+
+    def get(self, treatment_id):
+        treatment_id = int(treatment_id)
+        with self._lock:
+            entry = self._data.get(treatment_id)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, treatment = entry
+            if expires_at <= time.monotonic():
+                del self._data[treatment_id]
+                self.misses += 1
+                return None
+            self._data.move_to_end(treatment_id)
+            self.hits += 1
+            return treatment
+
+    def get_many(self, treatment_ids):
+        found = {}
+        missing = []
+        for treatment_id in treatment_ids:
+            treatment = self.get(treatment_id)
+            if treatment is None:
+                missing.append(treatment_id)
+            else:
+                found[treatment_id] = treatment
+        return found, missing
+
+    def set(self, treatment_id, treatment):
+        treatment_id = int(treatment_id)
+        with self._lock:
+            changes = self._recent_changes()
+            if treatment_id in changes:
+                treatment = changes[treatment_id]
+            self._store(treatment_id, treatment)
+
+    def _store(self, treatment_id, treatment):
+        if treatment is None:
+            self._data.pop(treatment_id, None)
+            return
+        self._data[treatment_id] = (time.monotonic() + self.ttl, treatment)
+        self._data.move_to_end(treatment_id)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def _recent_changes(self):
+        now = time.monotonic()
+        for treatment_id in [i for i, (until, _) in self._changes.items() if until <= now]:
+            del self._changes[treatment_id]
+        return {i: treatment for i, (_, treatment) in self._changes.items()}
+
+    def _patched(self, treatments, changes):
+        if not changes:
+            return treatments
+        patched = [t for t in treatments if t['id'] not in changes]
+        patched.extend(t for t in changes.values() if t is not None)
+        return sorted(patched, key=lambda t: t['id'])
+
+    # The full listing, kept as one entry so "every treatment of a doctor" is a cache hit
+    def get_catalog(self):
+        with self._lock:
+            if self._catalog is None or self._catalog[0] <= time.monotonic():
+                self._catalog = None
+                self.misses += 1
+                return None
+            self.hits += 1
+            return self._catalog[1]
+
+    def set_catalog(self, treatments):
+        with self._lock:
+            self._catalog = (time.monotonic() + self.ttl, self._patched(treatments, self._recent_changes()))
+
+    # A change published by the treatment service: the new row, or None once deleted.
+    # Cached entries are updated in place rather than dropped, so the next read doesn't
+    # refetch from a worker that hasn't seen the change yet.
+    def apply_change(self, treatment_id, treatment):
+        treatment_id = int(treatment_id)
+        with self._lock:
+            self._changes[treatment_id] = (time.monotonic() + self.change_window, treatment)
+            self._store(treatment_id, treatment)
+            if self._catalog is not None:
+                expires_at, catalog = self._catalog
+                self._catalog = (expires_at, self._patched(catalog, {treatment_id: treatment}))
+
+    def invalidate(self, treatment_id=None):
+        # Drop one treatment, or the whole cache when no id is given. Any change can
+        # move a treatment between doctors, so the catalog goes either way.
+        with self._lock:
+            self._catalog = None
+            if treatment_id is None:
+                self._data.clear()
+            else:
+                self._data.pop(int(treatment_id), None)
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / total, 4) if total else 0.0
+            }
@@ -0,0 +1,4 @@
+# WSGI entry point: `gunicorn wsgi:application`, settings in gunicorn.conf.py
+from app import create_app
+
+application = create_app()
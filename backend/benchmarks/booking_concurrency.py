@@ -0,0 +1,49 @@
+"""Fire many parallel bookings for the same slot at a running appointment service.
+Exactly one must succeed; the rest must be rejected with 409. The same check runs
+in-process, with the treatment service stubbed, in appointment-service/tests.
+
+    python benchmarks/booking_concurrency.py --token <jwt> --parallel 50
+"""
+import argparse
+import sys
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+
+def book(url, token, payload):
+    response = requests.post(f'{url}/appointments', json=payload,
+                             headers={'Authorization': f'Bearer {token}'}, timeout=30)
+    return response.status_code
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--url', default='http://localhost:5003')
+    parser.add_argument('--token', required=True)
+    parser.add_argument('--user-id', default='loadtest')
+    parser.add_argument('--treatment-id', type=int, default=1)
+    parser.add_argument('--date', default='2030-01-01')
+    parser.add_argument('--time', default='10:00')
+    parser.add_argument('--parallel', type=int, default=50)
+    args = parser.parse_args()
+
+    payload = {
+        'user_id': args.user_id,
+        'treatment_id': args.treatment_id,
+        'appointment_date': args.date,
+        'appointment_time': args.time
+    }
+    with ThreadPoolExecutor(max_workers=args.parallel) as pool:
+        statuses = Counter(pool.map(lambda _: book(args.url, args.token, payload), range(args.parallel)))
+
+    print(dict(statuses))
+    if statuses[201] != 1 or statuses[409] != args.parallel - 1:
+        print('FAIL: expected exactly one booking to succeed')
+        sys.exit(1)
+    print('OK')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,479 @@
+"""End-to-end load test of all four services.
+
+Starts the services (SQLite databases, and a SQLite stand-in for the user service's
+MySQL unless --mysql is given), seeds users, the 10 treatments, appointments and
+payments, then runs each scenario with concurrent clients for --duration seconds.
+Reports throughput and p50/p95/p99 latency per scenario and per endpoint, plus the
+DB queries and outbound HTTP calls each endpoint made (counted by loadtest_server.py,
+including the services it called). --output writes the results as JSON; --baseline
+compares against an earlier run and exits non-zero when an endpoint's p99 regressed
+by more than --max-regression.
+
+    python benchmarks/loadtest.py --appointments 1000000 --data-dir /tmp/glowcare-load \\
+        --output results.json --baseline previous.json
+"""
+import argparse
+import datetime
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+
+import jwt
+import requests
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+BACKEND = os.path.join(BENCHMARKS, '..')
+SECRET_KEY = 'loadtest-secret'
+SERVICES = [('user-service', 5001), ('treatment-service', 5002),
+            ('appointment-service', 5003), ('payment-service', 5004)]
+USER = 'http://localhost:5001'
+TREATMENT = 'http://localhost:5002'
+APPOINTMENT = 'http://localhost:5003'
+PAYMENT = 'http://localhost:5004'
+SEED_CHUNK = 50000
+SEED_START = datetime.datetime(2024, 1, 1, 9, 0)
+SEED_DAYS = 700
+
+
+def token(user_id, role='pasien'):
+    payload = {
+        'user_id': user_id,
+        'role': role,
+        'exp': datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(hours=6)
+    }
+    return jwt.encode(payload, SECRET_KEY, algorithm='HS256')
+
+
+def auth(user_id, role='pasien'):
+    return {'Authorization': f'Bearer {token(user_id, role)}'}
+
+
+# --- services ---------------------------------------------------------------------
+
+def service_env(data_dir):
+    env = dict(os.environ, SECRET_KEY=SECRET_KEY)
+    for service in ('treatment', 'appointment', 'payment'):
+        env[f'{service.upper()}_DATABASE_URL'] = 'sqlite:///' + os.path.join(data_dir, f'{service}.db')
+    return env
+
+
+def start_services(args, data_dir, processes):
+    env = service_env(data_dir)
+    for name, port in SERVICES:
+        if name != 'user-service':
+            subprocess.run([sys.executable, '-m', 'flask', '--app', 'app', 'init-db'],
+                           cwd=os.path.join(BACKEND, name), env=env, check=True, stdout=subprocess.DEVNULL)
+        command = [sys.executable, os.path.join(BENCHMARKS, 'loadtest_server.py'), name, '--port', str(port),
+                   '--server', args.server, '--workers', str(args.workers), '--threads', str(args.threads)]
+        if name == 'user-service' and not args.mysql:
+            command += ['--mysql-standin', os.path.join(data_dir, 'users.db')]
+        log = open(os.path.join(data_dir, f'{name}.log'), 'a')
+        processes.append(subprocess.Popen(command, env=env, stdout=log, stderr=subprocess.STDOUT))
+
+    for name, port in SERVICES:
+        deadline = time.time() + 60
+        while True:
+            try:
+                requests.get(f'http://localhost:{port}/', timeout=2)
+                break
+            except requests.RequestException:
+                if time.time() > deadline:
+                    raise RuntimeError(f'{name} did not start, see {data_dir}/{name}.log')
+                time.sleep(0.3)
+
+
+def stop_services(processes):
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        try:
+            process.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+
+# --- seeding ----------------------------------------------------------------------
+
+def user_connection(args, data_dir):
+    if args.mysql:
+        import pymysql
+        return pymysql.connect(host=os.environ.get('USER_DB_HOST', '127.0.0.1'),
+                               port=int(os.environ.get('USER_DB_PORT', 3306)),
+                               user=os.environ.get('USER_DB_USER', 'root'),
+                               password=os.environ.get('USER_DB_PASSWORD', ''),
+                               db=os.environ.get('USER_DB_NAME', 'user_service_db'))
+    import mysql_standin
+    return mysql_standin.connect(os.path.join(data_dir, 'users.db'))
+
+
+def seed_users(args, data_dir):
+    connection = user_connection(args, data_dir)
+    try:
+        with connection.cursor() as cursor:
+            rows = [(f'user{i}', f'pw{i}', 'pasien', f'Jl. Mawar No. {i}', f'0812{i:08d}')
+                    for i in range(1, args.users + 1)]
+            rows.append(('admin', 'admin', 'admin', None, None))
+            cursor.executemany('INSERT INTO users (username, password, role, address, phone_number) '
+                               'VALUES (%s, %s, %s, %s, %s)', rows)
+        connection.commit()
+    finally:
+        connection.close()
+
+
+def post_ndjson(url, rows):
+    body = '\n'.join(json.dumps(row) for row in rows)
+    response = requests.post(url, data=body, timeout=600,
+                             headers=dict(auth('loadtest-admin', 'admin'), **{'Content-Type': 'application/x-ndjson'}))
+    summary = response.json()
+    if summary.get('inserted') != len(rows):
+        raise RuntimeError(f'{url}: {summary.get("message")} {summary.get("errors", [])[:3]}')
+
+
+# Past appointments (no slot checks) spread over SEED_DAYS; on a fresh database the ids
+# come out as 1..n in order, which the payment rows rely on
+def seed_appointments(args, rng, prices):
+    users = []
+    for first in range(0, args.appointments, SEED_CHUNK):
+        rows = []
+        for _ in range(first, min(first + SEED_CHUNK, args.appointments)):
+            user = rng.randint(1, args.users)
+            users.append(user)
+            when = SEED_START + datetime.timedelta(days=rng.randrange(SEED_DAYS), hours=rng.randrange(8))
+            rows.append({
+                'user_id': f'user{user}',
+                'treatment_id': rng.choice(list(prices)),
+                'appointment_date': when.date().isoformat(),
+                'appointment_time': when.strftime('%H:%M'),
+                'status': 'completed',
+                'created_at': when.isoformat()
+            })
+        post_ndjson(f'{APPOINTMENT}/appointments/bulk?invoices=false', rows)
+    return users
+
+
+def seed_payments(args, rng, users, prices):
+    for first in range(0, len(users), SEED_CHUNK):
+        rows = []
+        for appointment_id in range(first + 1, min(first + SEED_CHUNK, len(users)) + 1):
+            pending = rng.random() < args.pending_ratio
+            rows.append({
+                'user_id': f'user{users[appointment_id - 1]}',
+                'appointment_id': appointment_id,
+                'amount': rng.choice(list(prices.values())),
+                'status': 'pending' if pending else 'completed',
+                'payment_method': None if pending else rng.choice(['credit_card', 'bank_transfer']),
+                'transaction_id': None if pending else f'TX-SEED-{appointment_id}'
+            })
+        post_ndjson(f'{PAYMENT}/payments/bulk', rows)
+
+
+# The seeded appointments carry no events, so the payment service's projection is
+# filled in one pass from the appointment service, and its rollup recomputed with the
+# treatments now known
+def rebuild_projection(data_dir):
+    for command in ('rebuild-projection', 'backfill-rollups'):
+        subprocess.run([sys.executable, '-m', 'flask', '--app', 'app', command],
+                       cwd=os.path.join(BACKEND, 'payment-service'), env=service_env(data_dir), check=True,
+                       stdout=subprocess.DEVNULL)
+
+
+def seed(args, data_dir):
+    marker = os.path.join(data_dir, 'seed.json')
+    if os.path.exists(marker):
+        with open(marker) as f:
+            return json.load(f)
+
+    started = time.perf_counter()
+    rng = random.Random(args.seed)
+    seed_users(args, data_dir)
+    prices = {t['id']: t['harga'] for t in requests.get(f'{TREATMENT}/treatments').json()}
+    users = seed_appointments(args, rng, prices)
+    seed_payments(args, rng, users, prices)
+    rebuild_projection(data_dir)
+    summary = {'users': args.users, 'treatments': len(prices), 'appointments': len(users),
+               'payments': len(users), 'seconds': round(time.perf_counter() - started, 1)}
+    with open(marker, 'w') as f:
+        json.dump(summary, f)
+    return summary
+
+
+# --- scenarios --------------------------------------------------------------------
+
+class Client:
+    def __init__(self, args, rng, treatments, record):
+        self.args = args
+        self.rng = rng
+        self.treatments = treatments
+        self.record = record
+        self.session = requests.Session()
+        self._tokens = {}
+
+    def random_user(self):
+        return self.rng.randint(1, self.args.users)
+
+    def headers(self, user_id, role='pasien'):
+        if user_id not in self._tokens:
+            self._tokens[user_id] = auth(user_id, role)
+        return self._tokens[user_id]
+
+    def call(self, endpoint, method, url, **kwargs):
+        started = time.perf_counter()
+        try:
+            response = self.session.request(method, url, timeout=60, **kwargs)
+        except requests.RequestException:
+            self.record(endpoint, time.perf_counter() - started, 'error', None)
+            return None
+        self.record(endpoint, time.perf_counter() - started, response.status_code, response.headers)
+        return response
+
+
+def login_storm(client):
+    user = client.random_user()
+    client.call('POST /api/login', 'POST', f'{USER}/api/login',
+                json={'username': f'user{user}', 'password': f'pw{user}'})
+
+
+def booking(client):
+    user = f'user{client.random_user()}'
+    treatment_id = client.rng.choice(client.treatments)
+    day = (datetime.date.today() + datetime.timedelta(days=client.rng.randint(1, 90))).isoformat()
+    response = client.call('GET /availability', 'GET', f'{APPOINTMENT}/availability',
+                           params={'treatment_id': treatment_id, 'date': day})
+    if response is None or response.status_code != 200 or not response.json()['available']:
+        return
+    client.call('POST /appointments', 'POST', f'{APPOINTMENT}/appointments', headers=client.headers(user),
+                json={'user_id': user, 'treatment_id': treatment_id, 'appointment_date': day,
+                      'appointment_time': client.rng.choice(response.json()['available'])})
+
+
+def admin_listing(client):
+    start = SEED_START.date() + datetime.timedelta(days=client.rng.randrange(SEED_DAYS))
+    params = {'limit': client.args.page_size, 'from': start.isoformat()}
+    for _ in range(client.args.pages):
+        response = client.call('GET /admin/appointments', 'GET', f'{APPOINTMENT}/admin/appointments',
+                               params=params, headers=client.headers('loadtest-admin', 'admin'))
+        if response is None or response.status_code != 200 or not response.json()['next_cursor']:
+            return
+        params = dict(params, cursor=response.json()['next_cursor'])
+
+
+def invoice_listing(client):
+    user = f'user{client.random_user()}'
+    client.call('GET /payments/invoices', 'GET', f'{PAYMENT}/payments/invoices', headers=client.headers(user))
+
+
+def payment_history(client):
+    user = f'user{client.random_user()}'
+    client.call('GET /payments/history', 'GET', f'{PAYMENT}/payments/history',
+                params={'limit': client.args.page_size}, headers=client.headers(user))
+
+
+# Profile page views with an occasional edit, which invalidates the cached profile
+def profile(client):
+    user = f'user{client.random_user()}'
+    if client.rng.random() < 0.05:
+        client.call('PUT /api/profile/edit', 'PUT', f'{USER}/api/profile/edit', headers=client.headers(user),
+                    json={'address': f'Jl. Melati No. {client.rng.randint(1, 999)}'})
+    client.call('GET /api/profile', 'GET', f'{USER}/api/profile', headers=client.headers(user))
+
+
+SCENARIOS = {
+    'login': login_storm,
+    'profile': profile,
+    'booking': booking,
+    'admin-listing': admin_listing,
+    'invoices': invoice_listing,
+    'history': payment_history,
+}
+
+
+# --- measurement ------------------------------------------------------------------
+
+def percentiles(latencies):
+    latencies = sorted(latencies)
+    if not latencies:
+        return {'p50': 0, 'p95': 0, 'p99': 0, 'max': 0}
+
+    def at(p):
+        return round(latencies[min(int(len(latencies) * p), len(latencies) - 1)] * 1000, 2)
+    return {'p50': at(0.50), 'p95': at(0.95), 'p99': at(0.99), 'max': round(latencies[-1] * 1000, 2)}
+
+
+def header_average(samples, name, cast=float):
+    values = [cast(headers[name]) for headers in samples if headers is not None and name in headers]
+    return round(sum(values) / len(values), 2) if values else None
+
+
+def run_scenario(args, name, treatments):
+    samples = defaultdict(list)  # endpoint -> [(latency, status, headers)]
+    measuring = threading.Event()
+    lock = threading.Lock()
+    iterations = Counter()
+
+    def record(endpoint, latency, status, headers):
+        if measuring.is_set():
+            with lock:
+                samples[endpoint].append((latency, status, headers))
+
+    def worker(number):
+        client = Client(args, random.Random(args.seed * 1000 + number), treatments, record)
+        while not stop.is_set():
+            SCENARIOS[name](client)
+            if measuring.is_set():
+                iterations[number] += 1
+
+    stop = threading.Event()
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(args.concurrency)]
+    for thread in threads:
+        thread.start()
+    time.sleep(args.warmup)
+    measuring.set()
+    started = time.perf_counter()
+    time.sleep(args.duration)
+    measuring.clear()
+    elapsed = time.perf_counter() - started
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    endpoints = {}
+    for endpoint, rows in sorted(samples.items()):
+        latencies = [latency for latency, _, _ in rows]
+        headers = [h for _, _, h in rows]
+        statuses = Counter(str(status) for _, status, _ in rows)
+        endpoints[endpoint] = {
+            'requests': len(rows),
+            'throughput': round(len(rows) / elapsed, 2),
+            'errors': sum(n for status, n in statuses.items() if status == 'error' or status.startswith('5')),
+            'statuses': dict(statuses),
+            'latency_ms': percentiles(latencies),
+            'db_queries': header_average(headers, 'X-Bench-DB-Queries'),
+            'db_ms': header_average(headers, 'X-Bench-DB-Ms'),
+            'http_calls': header_average(headers, 'X-Bench-HTTP-Calls'),
+            'db_queries_total': header_average(headers, 'X-Bench-DB-Queries-Total'),
+            'http_calls_total': header_average(headers, 'X-Bench-HTTP-Calls-Total'),
+        }
+    return {
+        'iterations': sum(iterations.values()),
+        'throughput': round(sum(iterations.values()) / elapsed, 2),
+        'latency_ms': percentiles([latency for rows in samples.values() for latency, _, _ in rows]),
+        'endpoints': endpoints
+    }
+
+
+def print_report(results):
+    print(f'\n{"scenario":14s} {"endpoint":26s} {"req/s":>8s} {"p50":>8s} {"p95":>8s} {"p99":>8s} '
+          f'{"err":>5s} {"db q":>6s} {"db ms":>7s} {"http":>5s} {"db q tot":>8s}')
+    for scenario, result in results['scenarios'].items():
+        for endpoint, stats in result['endpoints'].items():
+            latency = stats['latency_ms']
+            print(f'{scenario:14s} {endpoint:26s} {stats["throughput"]:8.1f} {latency["p50"]:8.1f} '
+                  f'{latency["p95"]:8.1f} {latency["p99"]:8.1f} {stats["errors"]:5d} '
+                  f'{stats["db_queries"] or 0:6.1f} {stats["db_ms"] or 0:7.2f} {stats["http_calls"] or 0:5.1f} '
+                  f'{stats["db_queries_total"] or 0:8.1f}')
+
+
+# Endpoint-by-endpoint comparison with an earlier results file; returns the regressions
+def compare(results, baseline_path, max_regression):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    regressions = []
+    print(f'\n{"scenario":14s} {"endpoint":26s} {"p99 before":>11s} {"p99 now":>9s} {"change":>8s} {"req/s change":>13s}')
+    for scenario, result in results['scenarios'].items():
+        for endpoint, stats in result['endpoints'].items():
+            before = baseline.get('scenarios', {}).get(scenario, {}).get('endpoints', {}).get(endpoint)
+            if not before or not before['latency_ms']['p99']:
+                continue
+            change = stats['latency_ms']['p99'] / before['latency_ms']['p99'] - 1
+            throughput = stats['throughput'] / before['throughput'] - 1 if before['throughput'] else 0
+            flag = '  REGRESSION' if change > max_regression else ''
+            print(f'{scenario:14s} {endpoint:26s} {before["latency_ms"]["p99"]:11.1f} '
+                  f'{stats["latency_ms"]["p99"]:9.1f} {change:+8.1%} {throughput:+13.1%}{flag}')
+            if flag:
+                regressions.append((scenario, endpoint))
+    return regressions
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=BACKEND, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--appointments', type=int, default=1000000)
+    parser.add_argument('--pending-ratio', type=float, default=0.3)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=30)
+    parser.add_argument('--warmup', type=float, default=3)
+    parser.add_argument('--page-size', type=int, default=50)
+    parser.add_argument('--pages', type=int, default=3, help='admin listing pages followed per iteration')
+    parser.add_argument('--server', choices=('threaded', 'gunicorn'), default='gunicorn')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--mysql', action='store_true', help='use the MySQL server from USER_DB_* instead of the stand-in')
+    parser.add_argument('--data-dir', help='keep databases here and reuse the seed on later runs')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='write the results as JSON')
+    parser.add_argument('--baseline', help='results JSON of an earlier run to compare with')
+    parser.add_argument('--max-regression', type=float, default=0.25)
+    args = parser.parse_args()
+
+    scenarios = args.scenarios.split(',')
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f'unknown scenarios: {", ".join(sorted(unknown))}')
+
+    temp_dir = None
+    if args.data_dir:
+        os.makedirs(args.data_dir, exist_ok=True)
+        data_dir = args.data_dir
+    else:
+        temp_dir = tempfile.TemporaryDirectory()
+        data_dir = temp_dir.name
+
+    processes = []
+    try:
+        start_services(args, data_dir, processes)
+        seeded = seed(args, data_dir)
+        print(f'seed: {seeded}')
+        treatments = [t['id'] for t in requests.get(f'{TREATMENT}/treatments').json()]
+
+        results = {
+            'started_at': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            'commit': git_commit(),
+            'config': {name: value for name, value in vars(args).items()
+                       if name not in ('output', 'baseline', 'data_dir')},
+            'seed': seeded,
+            'scenarios': {}
+        }
+        for name in scenarios:
+            print(f'running {name} for {args.duration:g}s with {args.concurrency} clients')
+            results['scenarios'][name] = run_scenario(args, name, treatments)
+    finally:
+        stop_services(processes)
+        if temp_dir:
+            temp_dir.cleanup()
+
+    print_report(results)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.baseline and compare(results, args.baseline, args.max_regression):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
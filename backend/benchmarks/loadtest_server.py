@@ -0,0 +1,158 @@
+"""Runs one service for benchmarks/loadtest.py, with per-request DB and HTTP call counting.
+
+Every response carries X-Bench-DB-Queries / X-Bench-DB-Ms / X-Bench-HTTP-Calls for the
+service itself and X-Bench-DB-Queries-Total / X-Bench-HTTP-Calls-Total including the
+services it called, so the load driver can attribute nested calls to the endpoint hit.
+
+    python benchmarks/loadtest_server.py appointment-service --port 5003 --server gunicorn --workers 2
+"""
+import argparse
+import contextvars
+import os
+import sys
+import threading
+import time
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+BACKEND = os.path.join(BENCHMARKS, '..')
+
+_current = contextvars.ContextVar('bench_counters', default=None)
+
+
+class Counters:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.db_queries = 0
+        self.db_seconds = 0.0
+        self.http_calls = 0
+        self.downstream_db_queries = 0
+        self.downstream_http_calls = 0
+
+    def add(self, **values):
+        with self._lock:
+            for name, value in values.items():
+                setattr(self, name, getattr(self, name) + value)
+
+
+def count_query(started):
+    counters = _current.get()
+    if counters is not None:
+        counters.add(db_queries=1, db_seconds=time.perf_counter() - started)
+
+
+def wrap_execute(cls):
+    for name in ('execute', 'executemany'):
+        original = getattr(cls, name)
+
+        def execute(self, *args, _original=original, **kwargs):
+            started = time.perf_counter()
+            try:
+                return _original(self, *args, **kwargs)
+            finally:
+                count_query(started)
+        setattr(cls, name, execute)
+
+
+def install_counters():
+    import pymysql.cursors
+    import requests
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+
+    import mysql_standin
+
+    @event.listens_for(Engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info['bench_started'] = time.perf_counter()
+
+    @event.listens_for(Engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        count_query(conn.info['bench_started'])
+
+    wrap_execute(pymysql.cursors.Cursor)
+    wrap_execute(mysql_standin.Cursor)
+
+    send = requests.Session.send
+
+    def counted_send(self, request, **kwargs):
+        response = send(self, request, **kwargs)
+        counters = _current.get()
+        if counters is not None:
+            counters.add(http_calls=1,
+                         downstream_db_queries=int(response.headers.get('X-Bench-DB-Queries-Total', 0)),
+                         downstream_http_calls=int(response.headers.get('X-Bench-HTTP-Calls-Total', 0)))
+        return response
+    requests.Session.send = counted_send
+
+
+def instrument(app):
+    @app.before_request
+    def start_counting():
+        _current.set(Counters())
+
+    @app.after_request
+    def add_count_headers(response):
+        counters = _current.get()
+        if counters is not None:
+            response.headers['X-Bench-DB-Queries'] = str(counters.db_queries)
+            response.headers['X-Bench-DB-Ms'] = f'{counters.db_seconds * 1000:.3f}'
+            response.headers['X-Bench-HTTP-Calls'] = str(counters.http_calls)
+            response.headers['X-Bench-DB-Queries-Total'] = str(counters.db_queries + counters.downstream_db_queries)
+            response.headers['X-Bench-HTTP-Calls-Total'] = str(counters.http_calls + counters.downstream_http_calls)
+        return response
+
+    @app.teardown_request
+    def stop_counting(exc):
+        _current.set(None)
+
+
+def load_app(args):
+    if args.mysql_standin:
+        import mysql_standin
+        mysql_standin.install(args.mysql_standin)
+    install_counters()
+    from app import app, create_app
+    instrument(app)
+    return create_app()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('service')
+    parser.add_argument('--port', type=int, required=True)
+    parser.add_argument('--server', choices=('threaded', 'gunicorn'), default='gunicorn')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--mysql-standin', help='SQLite file standing in for the user service MySQL')
+    args = parser.parse_args()
+
+    service_dir = os.path.join(BACKEND, args.service)
+    os.chdir(service_dir)
+    sys.path[:0] = [service_dir, BACKEND, BENCHMARKS]
+
+    if args.server == 'threaded':
+        load_app(args).run(port=args.port, threaded=True)
+        return
+
+    # What the services read to size per-process pools, as gunicorn.conf.py would set them
+    os.environ['WEB_CONCURRENCY'] = str(args.workers)
+    os.environ['GUNICORN_THREADS'] = str(args.threads)
+    from gunicorn.app.base import BaseApplication
+
+    class Server(BaseApplication):
+        def load_config(self):
+            self.cfg.set('bind', f'127.0.0.1:{args.port}')
+            self.cfg.set('workers', args.workers)
+            self.cfg.set('worker_class', 'gthread')
+            self.cfg.set('threads', args.threads)
+            self.cfg.set('timeout', 120)
+
+        def load(self):
+            # In each worker, so the outbox thread and connection pools are per process
+            return load_app(args)
+
+    Server().run()
+
+
+if __name__ == '__main__':
+    main()
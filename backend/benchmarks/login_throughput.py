@@ -0,0 +1,163 @@
+"""Login throughput of the user service at different password hashing costs.
+
+For each --iterations value, starts the user service on a SQLite stand-in for its
+MySQL with PASSWORD_HASH_ITERATIONS set to it, seeds --users users whose passwords
+are hashed at that cost, then drives /api/login with concurrent clients for
+--seconds while one more client reads /api/profile every 50 ms. Reports logins/s,
+login p50/p99, the logins turned away with 503 because the hashing pool was full,
+and the profile p99, which shows whether the login storm starves other endpoints.
+
+    python benchmarks/login_throughput.py --iterations 100000,300000,600000 --concurrency 32
+"""
+import argparse
+import datetime
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import jwt
+import requests
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+BACKEND = os.path.join(BENCHMARKS, '..')
+SECRET_KEY = 'loadtest-secret'
+USER = 'http://localhost:5001'
+PASSWORD = 'bench-password'
+
+sys.path[:0] = [os.path.join(BACKEND, 'user-service')]
+import mysql_standin  # noqa: E402
+from passwords import hash_password  # noqa: E402
+
+
+def token(user_id):
+    payload = {
+        'user_id': user_id,
+        'role': 'pasien',
+        'exp': datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(hours=1)
+    }
+    return jwt.encode(payload, SECRET_KEY, algorithm='HS256')
+
+
+def start(args, iterations, database):
+    connection = mysql_standin.connect(database)
+    try:
+        # Every user gets the same password, so one hash at this cost seeds them all
+        password_hash = hash_password(PASSWORD, iterations)
+        with connection.cursor() as cursor:
+            cursor.executemany('INSERT INTO users (username, password, role) VALUES (%s, %s, %s)',
+                               [(f'user{i}', password_hash, 'pasien') for i in range(1, args.users + 1)])
+        connection.commit()
+    finally:
+        connection.close()
+
+    env = dict(os.environ, SECRET_KEY=SECRET_KEY, PASSWORD_HASH_ITERATIONS=str(iterations))
+    if args.hash_workers:
+        env['PASSWORD_HASH_WORKERS'] = str(args.hash_workers)
+    if args.hash_max_in_flight:
+        env['PASSWORD_HASH_MAX_IN_FLIGHT'] = str(args.hash_max_in_flight)
+    command = [sys.executable, os.path.join(BENCHMARKS, 'loadtest_server.py'), 'user-service',
+               '--port', '5001', '--server', args.server, '--workers', str(args.workers),
+               '--threads', str(args.threads), '--mysql-standin', database]
+    process = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    deadline = time.time() + 30
+    while True:
+        try:
+            requests.get(f'{USER}/', timeout=1)
+            return process
+        except requests.RequestException:
+            if time.time() > deadline:
+                process.kill()
+                raise RuntimeError('user service did not start')
+            time.sleep(0.2)
+
+
+def drive(args):
+    logins, rejected, errors, profiles = [], [], [], []
+    deadline = time.time() + args.seconds
+
+    def login_client(number):
+        session = requests.Session()
+        user = number
+        while time.time() < deadline:
+            user = user % args.users + 1
+            started = time.perf_counter()
+            try:
+                status = session.post(f'{USER}/api/login', timeout=60,
+                                      json={'username': f'user{user}', 'password': PASSWORD}).status_code
+            except requests.RequestException:
+                status = None
+            latency = time.perf_counter() - started
+            if status == 200:
+                logins.append(latency)
+            elif status == 503:
+                rejected.append(latency)
+                time.sleep(0.05)
+            else:
+                errors.append(latency)
+
+    def profile_client():
+        session = requests.Session()
+        headers = {'Authorization': f'Bearer {token("user1")}'}
+        while time.time() < deadline:
+            started = time.perf_counter()
+            try:
+                if session.get(f'{USER}/api/profile', headers=headers, timeout=60).status_code == 200:
+                    profiles.append(time.perf_counter() - started)
+            except requests.RequestException:
+                pass
+            time.sleep(0.05)  # a latency probe, not extra load
+
+    threads = [threading.Thread(target=login_client, args=(n,)) for n in range(args.concurrency)]
+    threads.append(threading.Thread(target=profile_client))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    logins.sort()
+    profiles.sort()
+    return logins, len(rejected), len(errors), profiles
+
+
+def percentile(latencies, p):
+    return latencies[max(int(len(latencies) * p) - 1, 0)] * 1000 if latencies else 0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--iterations', default='100000,300000,600000',
+                        help='comma-separated PBKDF2 iteration counts')
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--server', choices=('threaded', 'gunicorn'), default='gunicorn')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--hash-workers', type=int, help='PASSWORD_HASH_WORKERS (default: CPU count / workers)')
+    parser.add_argument('--hash-max-in-flight', type=int,
+                        help='PASSWORD_HASH_MAX_IN_FLIGHT (default: threads - 1)')
+    args = parser.parse_args()
+
+    print(f'{"iterations":>10s} {"logins/s":>9s} {"p50 ms":>8s} {"p99 ms":>8s} {"503s":>6s} '
+          f'{"errors":>7s} {"profile p99 ms":>15s}')
+    with tempfile.TemporaryDirectory() as tmp:
+        for iterations in (int(value) for value in args.iterations.split(',')):
+            process = start(args, iterations, os.path.join(tmp, f'users-{iterations}.db'))
+            try:
+                logins, rejected, errors, profiles = drive(args)
+            finally:
+                process.terminate()
+                try:
+                    process.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+                    process.wait()
+            print(f'{iterations:10d} {len(logins) / args.seconds:9.1f} {percentile(logins, 0.5):8.1f} '
+                  f'{percentile(logins, 0.99):8.1f} {rejected:6d} {errors:7d} {percentile(profiles, 0.99):15.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""SQLite-backed stand-in for the PyMySQL calls the user service makes, so the load
+test can run the user service without a MySQL server. Only what app.py and
+db_pool.py use is implemented: %s parameters, dict rows, commit/rollback/ping.
+"""
+import sqlite3
+
+import pymysql
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    username VARCHAR(100) NOT NULL UNIQUE,
+    password VARCHAR(255) NOT NULL,
+    role VARCHAR(20) NOT NULL DEFAULT 'pasien',
+    address TEXT,
+    phone_number VARCHAR(20)
+)
+'''
+
+
+class Cursor:
+    def __init__(self, connection):
+        self._cursor = connection.cursor()
+        self.rowcount = -1
+
+    def execute(self, sql, params=()):
+        self._cursor.execute(sql.replace('%s', '?'), tuple(params or ()))
+        self.rowcount = self._cursor.rowcount
+        return self.rowcount
+
+    def executemany(self, sql, rows):
+        self._cursor.executemany(sql.replace('%s', '?'), rows)
+        self.rowcount = self._cursor.rowcount
+        return self.rowcount
+
+    def _row(self, row):
+        return None if row is None else {d[0]: v for d, v in zip(self._cursor.description, row)}
+
+    def fetchone(self):
+        return self._row(self._cursor.fetchone())
+
+    def fetchall(self):
+        return [self._row(row) for row in self._cursor.fetchall()]
+
+    def close(self):
+        self._cursor.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class Connection:
+    def __init__(self, path):
+        self._connection = sqlite3.connect(path, timeout=5, check_same_thread=False)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('PRAGMA synchronous=NORMAL')
+
+    def cursor(self):
+        return Cursor(self._connection)
+
+    def commit(self):
+        self._connection.commit()
+
+    def rollback(self):
+        self._connection.rollback()
+
+    def ping(self, reconnect=False):
+        self._connection.execute('SELECT 1')
+
+    def close(self):
+        self._connection.close()
+
+
+def connect(path):
+    connection = Connection(path)
+    connection._connection.execute(SCHEMA)
+    return connection
+
+
+# Route every pymysql.connect() in this process to the SQLite file
+def install(path):
+    connect(path).close()
+    pymysql.connect = lambda **kwargs: Connection(path)
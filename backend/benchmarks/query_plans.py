@@ -0,0 +1,115 @@
+"""Query plans and timings for the hot predicates, before and after ensure_indexes().
+
+    python benchmarks/query_plans.py --rows 200000
+"""
+import argparse
+import importlib.util
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, text
+
+BACKEND = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.append(BACKEND)
+from common.migrations import ensure_indexes
+
+
+def load_service(name):
+    path = os.path.join(BACKEND, name, 'app.py')
+    sys.path.insert(0, os.path.dirname(path))
+    spec = importlib.util.spec_from_file_location(name.replace('-', '_'), path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+QUERIES = {
+    'payment': [
+        ('pending invoices of a user',
+         "SELECT * FROM payment WHERE user_id = :user AND status = 'pending'"),
+        ('webhook idempotency check',
+         "SELECT * FROM payment WHERE appointment_id = :appointment_id LIMIT 1"),
+    ],
+    'appointment': [
+        ('appointments of a user in a month',
+         "SELECT * FROM appointment WHERE user_id = :user "
+         "AND appointment_date BETWEEN '2026-03-01' AND '2026-03-31'"),
+        ('bookings of a treatment slot',
+         "SELECT * FROM appointment WHERE treatment_id = :treatment_id "
+         "AND appointment_date = '2026-03-15' AND appointment_time = '10:00'"),
+    ],
+}
+PARAMS = {'user': 'user42', 'appointment_id': 12345, 'treatment_id': 3}
+
+
+def seed(engine, rows):
+    now = datetime(2026, 1, 1)
+    appointments, payments = [], []
+    for i in range(1, rows + 1):
+        date = now + timedelta(days=random.randint(0, 364))
+        user = f'user{random.randint(1, rows // 50 or 1)}'
+        appointments.append({
+            'id': i, 'user_id': user, 'treatment_id': random.randint(1, 10),
+            'appointment_date': date.strftime('%Y-%m-%d'),
+            'appointment_time': f'{random.randint(9, 17):02d}:00',
+            'status': 'confirmed', 'created_at': now + timedelta(seconds=i)
+        })
+        payments.append({
+            'id': i, 'user_id': user, 'appointment_id': i, 'amount': 150000.0,
+            'status': random.choice(['pending', 'completed']), 'created_at': now + timedelta(seconds=i)
+        })
+    with engine.begin() as conn:
+        conn.execute(text(
+            "INSERT INTO appointment (id, user_id, treatment_id, appointment_date, appointment_time, status, created_at) "
+            "VALUES (:id, :user_id, :treatment_id, :appointment_date, :appointment_time, :status, :created_at)"
+        ), appointments)
+        conn.execute(text(
+            "INSERT INTO payment (id, user_id, appointment_id, amount, status, created_at) "
+            "VALUES (:id, :user_id, :appointment_id, :amount, :status, :created_at)"
+        ), payments)
+
+
+def report(engine, label, repeat):
+    print(f'\n== {label}')
+    with engine.connect() as conn:
+        for table, queries in QUERIES.items():
+            for name, sql in queries:
+                plan = conn.execute(text('EXPLAIN QUERY PLAN ' + sql), PARAMS).fetchall()
+                started = time.perf_counter()
+                for _ in range(repeat):
+                    conn.execute(text(sql), PARAMS).fetchall()
+                elapsed = (time.perf_counter() - started) / repeat * 1000
+                print(f'{name:40s} {elapsed:9.3f} ms  {" | ".join(row[-1] for row in plan)}')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    appointment_service = load_service('appointment-service')
+    payment_service = load_service('payment-service')
+    tables = [appointment_service.Appointment.__table__, payment_service.Payment.__table__]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine('sqlite:///' + os.path.join(tmp, 'bench.db'))
+        # Start from a pre-index schema, the way existing databases look
+        for table in tables:
+            table.create(engine)
+            for index in table.indexes:
+                index.drop(engine)
+        seed(engine, args.rows)
+        report(engine, f'without indexes ({args.rows} rows)', args.repeat)
+
+        for metadata in {t.metadata for t in tables}:
+            ensure_indexes(engine, metadata)
+        report(engine, 'after ensure_indexes()', args.repeat)
+
+
+if __name__ == '__main__':
+    main()
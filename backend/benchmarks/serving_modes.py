@@ -0,0 +1,180 @@
+"""Threaded (werkzeug), gunicorn (wsgi.py) and ASGI (uvicorn + asgi.py) serving of the
+listing endpoints.
+
+Starts the treatment, appointment and payment services on temporary SQLite files,
+seeds appointments and payments through the bulk endpoints, then drives each
+listing endpoint with concurrent clients and reports throughput and latency.
+--chunk-size sets FANOUT_CHUNK_SIZE, i.e. how many ids go into each of the
+concurrent downstream lookups; compare e.g. 500 (one call) with 50.
+
+    python benchmarks/serving_modes.py --rows 1000 --concurrency 32 --seconds 10
+"""
+import argparse
+import datetime
+import importlib.util
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import jwt
+import requests
+
+BACKEND = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+SECRET_KEY = 'your-secret-key'
+SERVICES = [('treatment-service', 5002), ('appointment-service', 5003), ('payment-service', 5004)]
+ENDPOINTS = [
+    ('http://localhost:5003/admin/appointments?limit={limit}', 'admin'),
+    ('http://localhost:5004/payments/invoices', 'user'),
+    ('http://localhost:5004/payments/history?limit={limit}', 'user'),
+]
+
+THREADED = 'from app import create_app; create_app().run(port={port}, threaded=True)'
+
+
+def token(user_id, role):
+    payload = {
+        'user_id': user_id,
+        'role': role,
+        'exp': datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(hours=1)
+    }
+    return jwt.encode(payload, SECRET_KEY, algorithm='HS256')
+
+
+def start(mode, tmp, workers, chunk_size, processes):
+    env = dict(os.environ, FANOUT_CHUNK_SIZE=str(chunk_size), OUTBOX_INTERVAL='3600')
+    for name, _ in SERVICES:
+        service = name.split('-')[0].upper()
+        env[f'{service}_DATABASE_URL'] = 'sqlite:///' + os.path.join(tmp, f'{mode}-{service.lower()}.db')
+
+    for name, port in SERVICES:
+        cwd = os.path.join(BACKEND, name)
+        subprocess.run([sys.executable, '-m', 'flask', '--app', 'app', 'init-db'], cwd=cwd, env=env,
+                       check=True, stdout=subprocess.DEVNULL)
+        if mode == 'threaded':
+            command = [sys.executable, '-c', THREADED.format(port=port)]
+        elif mode == 'gunicorn':
+            command = [sys.executable, '-m', 'gunicorn', 'wsgi:application', '--bind', f'127.0.0.1:{port}',
+                       '--workers', str(workers)]
+        else:
+            command = [sys.executable, '-m', 'uvicorn', 'asgi:application', '--port', str(port),
+                       '--workers', str(workers), '--log-level', 'warning']
+        processes.append(subprocess.Popen(command, cwd=cwd, env=env,
+                                          stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL))
+
+    for _, port in SERVICES:
+        deadline = time.time() + 30
+        while True:
+            try:
+                requests.get(f'http://localhost:{port}/', timeout=1)
+                break
+            except requests.RequestException:
+                if time.time() > deadline:
+                    raise RuntimeError(f'service on port {port} did not start')
+                time.sleep(0.2)
+
+
+def seed(rows, user_id):
+    admin = {'Authorization': f'Bearer {token("bench-admin", "admin")}'}
+    treatments = [t['id'] for t in requests.get('http://localhost:5002/treatments').json()]
+    start_date = datetime.date(2025, 1, 1)
+    appointments = [{
+        'user_id': user_id,
+        'treatment_id': random.choice(treatments),
+        'appointment_date': (start_date + datetime.timedelta(days=i % 300)).isoformat(),
+        'appointment_time': f'{9 + i % 8:02d}:00',
+        'status': 'completed'
+    } for i in range(rows)]
+    response = requests.post('http://localhost:5003/appointments/bulk?invoices=false',
+                             json=appointments, headers=admin, timeout=300)
+    response.raise_for_status()
+
+    appointment_ids = []
+    cursor = None
+    while True:
+        params = {'limit': 500, **({'cursor': cursor} if cursor else {})}
+        page = requests.get('http://localhost:5003/admin/appointments', params=params, headers=admin).json()
+        appointment_ids += [a['id'] for a in page['appointments']]
+        cursor = page['next_cursor']
+        if not cursor:
+            break
+    payments = [{'user_id': user_id, 'appointment_id': id, 'amount': 100000, 'status': 'pending'}
+                for id in appointment_ids]
+    response = requests.post('http://localhost:5004/payments/bulk', json=payments, headers=admin, timeout=300)
+    response.raise_for_status()
+
+
+def drive(url, headers, concurrency, seconds):
+    latencies, errors = [], []
+    deadline = time.time() + seconds
+
+    def client():
+        session = requests.Session()
+        while time.time() < deadline:
+            started = time.perf_counter()
+            try:
+                ok = session.get(url, headers=headers, timeout=30).status_code == 200
+            except requests.RequestException:
+                ok = False
+            (latencies if ok else errors).append(time.perf_counter() - started)
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    latencies.sort()
+    return latencies, len(errors)
+
+
+def percentile(latencies, p):
+    return latencies[max(int(len(latencies) * p) - 1, 0)] * 1000 if latencies else 0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--modes', default='threaded,gunicorn,asgi')
+    parser.add_argument('--rows', type=int, default=1000)
+    parser.add_argument('--limit', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--workers', type=int, default=1, help='gunicorn/uvicorn worker processes')
+    parser.add_argument('--chunk-size', type=int, default=100)
+    args = parser.parse_args()
+
+    modes = args.modes.split(',')
+    for mode, module in (('gunicorn', 'gunicorn'), ('asgi', 'uvicorn')):
+        if mode in modes and importlib.util.find_spec(module) is None:
+            print(f'{module} is not installed, skipping the {mode} mode')
+            modes.remove(mode)
+
+    headers = {'admin': {'Authorization': f'Bearer {token("bench-admin", "admin")}'},
+               'user': {'Authorization': f'Bearer {token("bench-user", "pasien")}'}}
+    print(f'{"mode":9s} {"endpoint":42s} {"req/s":>8s} {"p50 ms":>8s} {"p99 ms":>8s} {"errors":>7s}')
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode in modes:
+            processes = []
+            try:
+                start(mode, tmp, args.workers, args.chunk_size, processes)
+                seed(args.rows, 'bench-user')
+                for url, role in ENDPOINTS:
+                    url = url.format(limit=args.limit)
+                    latencies, errors = drive(url, headers[role], args.concurrency, args.seconds)
+                    path = url.split('localhost')[1]
+                    print(f'{mode:9s} {path:42s} {len(latencies) / args.seconds:8.1f} '
+                          f'{percentile(latencies, 0.5):8.1f} {percentile(latencies, 0.99):8.1f} {errors:7d}')
+            finally:
+                for process in processes:
+                    process.terminate()
+                    try:
+                        process.wait(timeout=10)
+                    except subprocess.TimeoutExpired:
+                        process.kill()
+                        process.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,11 @@
+import os
+
+from a2wsgi import WSGIMiddleware
+
+# ASGI wrapper for the Flask apps, served by e.g. uvicorn. Each request runs on
+# one of ASGI_THREADS threads per worker process while the event loop handles
+# the connections.
+
+
+def asgi_app(app):
+    return WSGIMiddleware(app, workers=int(os.environ.get('ASGI_THREADS', 16)))
@@ -0,0 +1,135 @@
+import hashlib
+import hmac
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from functools import wraps
+
+import jwt
+from flask import current_app, jsonify, request
+
+# Shared token_required decorator. Verified tokens are cached (keyed by an HMAC
+# digest of the token, never the token itself) until their own exp, so repeated
+# requests with the same token skip signature verification.
+
+
+def decode_hs256(token, secret):
+    return jwt.decode(token, secret, algorithms=["HS256"])
+
+
+class VerifiedTokenCache:
+    def __init__(self, maxsize=10000, max_ttl=3600):
+        self.maxsize = maxsize
+        self.max_ttl = max_ttl
+        self._data = OrderedDict()  # digest -> (expires_at, claims)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, claims = entry
+            if expires_at <= time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return claims
+
+    def set(self, key, claims):
+        expires_at = time.time() + self.max_ttl
+        if 'exp' in claims:
+            expires_at = min(expires_at, float(claims['exp']))
+        with self._lock:
+            self._data[key] = (expires_at, claims)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+token_cache = VerifiedTokenCache()
+_verifier = decode_hs256
+_stats_lock = threading.Lock()
+_stats = {'cache_hits': 0, 'verifications': 0, 'verify_seconds': 0.0, 'rejected': 0}
+
+
+# Swap in a faster verifier, e.g. a native JWT library; it must raise jwt exceptions
+def set_verifier(verifier):
+    global _verifier
+    _verifier = verifier
+    token_cache.clear()
+
+
+def auth_stats():
+    with _stats_lock:
+        return dict(_stats, cache_size=len(token_cache))
+
+
+def _record(name, value=1):
+    with _stats_lock:
+        _stats[name] += value
+
+
+def _token_digest(token, secret):
+    return hmac.new(secret.encode(), token.encode(), hashlib.sha256).hexdigest()
+
+
+def verify_token(token, secret):
+    key = _token_digest(token, secret)
+    claims = token_cache.get(key)
+    if claims is not None:
+        _record('cache_hits')
+        return claims
+
+    started = time.perf_counter()
+    try:
+        claims = _verifier(token, secret)
+    finally:
+        _record('verifications')
+        _record('verify_seconds', time.perf_counter() - started)
+    token_cache.set(key, claims)
+    return claims
+
+
+# Short-lived token a service sends when it calls another one outside of a user request;
+# receivers check its 'service' role
+def service_token(service_name):
+    payload = {
+        'user_id': service_name,
+        'role': 'service',
+        'exp': datetime.now(timezone.utc) + timedelta(minutes=5)
+    }
+    return jwt.encode(payload, current_app.config['SECRET_KEY'], algorithm="HS256")
+
+
+def token_required(f):
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        header = request.headers.get('Authorization')
+        if not header:
+            return jsonify({'message': 'Token is missing!'}), 401
+
+        parts = header.split()
+        if len(parts) != 2 or parts[0].lower() != 'bearer':
+            _record('rejected')
+            return jsonify({'message': 'Authorization header must be "Bearer <token>"!'}), 401
+
+        try:
+            request.user_data = verify_token(parts[1], current_app.config['SECRET_KEY'])
+        except jwt.ExpiredSignatureError:
+            _record('rejected')
+            return jsonify({'message': 'Token has expired!'}), 401
+        except jwt.InvalidTokenError:
+            _record('rejected')
+            return jsonify({'message': 'Token is invalid!'}), 401
+
+        return f(*args, **kwargs)
+    return decorated
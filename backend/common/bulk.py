@@ -0,0 +1,48 @@
+import json
+import os
+
+from flask import request
+
+from common.export import NDJSON_MIMETYPE
+
+# Request bodies for bulk ingestion endpoints: a JSON array, or NDJSON with one
+# object per line. Rows are validated by the caller and inserted in chunks.
+
+BULK_CHUNK_SIZE = int(os.environ.get('BULK_CHUNK_SIZE', 5000))
+BULK_MAX_ROWS = int(os.environ.get('BULK_MAX_ROWS', 200000))
+
+
+class BulkError(ValueError):
+    pass
+
+
+# Returns (rows, errors): rows is a list of (row number, object); a malformed NDJSON
+# line becomes an error for that row instead of failing the whole request
+def read_bulk_rows():
+    rows, errors = [], []
+    if request.mimetype == NDJSON_MIMETYPE:
+        for number, line in enumerate(request.get_data(as_text=True).splitlines()):
+            if not line.strip():
+                continue
+            try:
+                rows.append((number, json.loads(line)))
+            except ValueError as e:
+                errors.append({'row': number, 'error': f'Invalid JSON: {e}'})
+    else:
+        data = request.get_json(silent=True)
+        if not isinstance(data, list):
+            raise BulkError('Body must be a JSON array or application/x-ndjson')
+        rows = list(enumerate(data))
+
+    if len(rows) + len(errors) > BULK_MAX_ROWS:
+        raise BulkError(f'At most {BULK_MAX_ROWS} rows per request')
+    return rows, errors
+
+
+def bulk_summary(inserted, errors):
+    return {
+        'message': f'{inserted} rows inserted, {len(errors)} rejected',
+        'inserted': inserted,
+        'rejected': len(errors),
+        'errors': sorted(errors, key=lambda e: e['row'])
+    }
@@ -0,0 +1,53 @@
+import os
+import sqlite3
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Per-service database settings. The URI comes from <SERVICE>_DATABASE_URL or
+# DATABASE_URL and defaults to the service's SQLite file. SQLite connections get
+# WAL and friends at connect time; server databases get pool settings instead.
+
+SQLITE_PRAGMAS = {
+    'journal_mode': os.environ.get('SQLITE_JOURNAL_MODE', 'WAL'),
+    'synchronous': os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL'),
+    'busy_timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000)),
+    'mmap_size': int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)),
+    'temp_store': 'MEMORY',
+}
+
+
+def database_uri(service, default_path):
+    return (os.environ.get(f'{service.upper()}_DATABASE_URL')
+            or os.environ.get('DATABASE_URL')
+            or 'sqlite:///' + default_path)
+
+
+def engine_options(uri):
+    if uri.startswith('sqlite'):
+        # Python's own lock wait, on top of the busy_timeout pragma
+        return {'connect_args': {'timeout': SQLITE_PRAGMAS['busy_timeout'] / 1000}}
+    return {
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', 10)),
+        'max_overflow': int(os.environ.get('DB_POOL_MAX_OVERFLOW', 20)),
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', 1800)),
+        'pool_timeout': float(os.environ.get('DB_POOL_TIMEOUT', 30)),
+        'pool_pre_ping': True,
+    }
+
+
+def configure_database(app, service, default_path):
+    uri = database_uri(service, default_path)
+    app.config['SQLALCHEMY_DATABASE_URI'] = uri
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(uri)
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+
+
+@event.listens_for(Engine, 'connect')
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    for name, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f'PRAGMA {name}={value}')
+    cursor.close()
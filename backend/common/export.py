@@ -0,0 +1,33 @@
+import json
+from itertools import islice
+
+from flask import Response, request, stream_with_context
+
+# Streaming NDJSON exports: rows are read with yield_per and written one line at a
+# time, so memory stays flat however many rows are exported.
+
+NDJSON_MIMETYPE = 'application/x-ndjson'
+EXPORT_CHUNK_SIZE = 1000
+
+
+def wants_ndjson():
+    if request.args.get('format') == 'ndjson':
+        return True
+    return request.accept_mimetypes.best == NDJSON_MIMETYPE
+
+
+def chunked(iterable, size=EXPORT_CHUNK_SIZE):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+# serialize_chunk(list of rows) -> list of dicts, so lookups can be batched per chunk
+def ndjson_response(query, serialize_chunk, chunk_size=EXPORT_CHUNK_SIZE):
+    def generate():
+        for chunk in chunked(query.yield_per(chunk_size), chunk_size):
+            yield ''.join(json.dumps(item, default=str) + '\n' for item in serialize_chunk(chunk))
+    return Response(stream_with_context(generate()), mimetype=NDJSON_MIMETYPE)
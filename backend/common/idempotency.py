@@ -0,0 +1,168 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from datetime import datetime, timedelta
+from functools import wraps
+
+from flask import Response, jsonify, make_response, request
+from sqlalchemy import delete, select
+from sqlalchemy.exc import IntegrityError
+
+# Idempotency-Key support for mutating endpoints. The first request with a key claims
+# it in the service's database and runs; its response (anything below 500) is stored
+# for the TTL and replayed for every retry with the same key, user and endpoint.
+# Completed responses are also kept in a per-process LRU, so a retry storm costs a
+# dict lookup. The model needs: key (primary key), fingerprint, status_code, body,
+# mimetype and expires_at.
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+MAX_KEY_LENGTH = 100
+
+StoredResponse = namedtuple('StoredResponse', 'fingerprint status_code body mimetype')
+
+
+class IdempotencyStore:
+    def __init__(self, db, model, ttl=86400, claim_timeout=60, maxsize=10000, purge_interval=300):
+        self.db = db
+        self.model = model
+        self.ttl = ttl
+        self.claim_timeout = claim_timeout  # a claim whose request died is released after this
+        self.maxsize = maxsize
+        self.purge_interval = purge_interval
+        self._cache = OrderedDict()  # scoped key -> (expires_at, StoredResponse)
+        self._lock = threading.Lock()
+        self._last_purge = 0.0
+        self._stats = {'cache_hits': 0, 'db_hits': 0, 'executed': 0, 'conflicts': 0}
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, cache_size=len(self._cache))
+
+    def _record(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def _cached(self, key):
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is None:
+                return None
+            expires_at, stored = entry
+            if expires_at <= time.time():
+                del self._cache[key]
+                return None
+            self._cache.move_to_end(key)
+            return stored
+
+    def _cache_set(self, key, stored, ttl):
+        with self._lock:
+            self._cache[key] = (time.time() + ttl, stored)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.maxsize:
+                self._cache.popitem(last=False)
+
+    def _load(self, key):
+        session = self.db.session
+        row = session.execute(select(self.model).where(self.model.key == key)
+                              .execution_options(populate_existing=True)).scalar_one_or_none()
+        if row is None:
+            return None
+        remaining = (row.expires_at - datetime.utcnow()).total_seconds()
+        if remaining <= 0:
+            session.delete(row)
+            session.commit()
+            return None
+        stored = StoredResponse(row.fingerprint, row.status_code, row.body, row.mimetype)
+        if stored.status_code is not None:
+            self._cache_set(key, stored, remaining)
+        return stored
+
+    def _claim(self, key, fingerprint):
+        session = self.db.session
+        self._purge_expired()
+        session.add(self.model(key=key, fingerprint=fingerprint,
+                               expires_at=datetime.utcnow() + timedelta(seconds=self.claim_timeout)))
+        try:
+            session.commit()
+            return True
+        except IntegrityError:
+            session.rollback()
+            return False
+
+    def _release(self, key):
+        session = self.db.session
+        session.rollback()
+        session.execute(delete(self.model).where(self.model.key == key))
+        session.commit()
+
+    def _purge_expired(self):
+        now = time.monotonic()
+        if now - self._last_purge < self.purge_interval:
+            return
+        self._last_purge = now
+        self.db.session.execute(delete(self.model).where(self.model.expires_at <= datetime.utcnow()))
+        self.db.session.commit()
+
+    def _execute(self, view, key, args, kwargs):
+        self._record('executed')
+        try:
+            response = make_response(view(*args, **kwargs))
+        except Exception:
+            self._release(key)
+            raise
+        if response.status_code >= 500:
+            # Failed requests may be retried for real
+            self._release(key)
+            return response
+
+        session = self.db.session
+        row = session.get(self.model, key)
+        row.status_code = response.status_code
+        row.body = response.get_data(as_text=True)
+        row.mimetype = response.mimetype
+        row.expires_at = datetime.utcnow() + timedelta(seconds=self.ttl)
+        session.commit()
+        self._cache_set(key, StoredResponse(row.fingerprint, row.status_code, row.body, row.mimetype), self.ttl)
+        return response
+
+    def _replay(self, stored, fingerprint):
+        if stored.fingerprint != fingerprint:
+            self._record('conflicts')
+            return jsonify({'message': f'{IDEMPOTENCY_HEADER} was already used for a different request'}), 422
+        if stored.status_code is None:
+            self._record('conflicts')
+            return jsonify({'message': f'A request with this {IDEMPOTENCY_HEADER} is still in progress'}), 409
+        response = Response(stored.body, status=stored.status_code, mimetype=stored.mimetype)
+        response.headers[REPLAYED_HEADER] = 'true'
+        return response
+
+    # Use below token_required, so keys are scoped to the caller
+    def idempotent(self, f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            idempotency_key = request.headers.get(IDEMPOTENCY_HEADER)
+            if not idempotency_key:
+                return f(*args, **kwargs)
+            if len(idempotency_key) > MAX_KEY_LENGTH:
+                return jsonify({'message': f'{IDEMPOTENCY_HEADER} must be at most {MAX_KEY_LENGTH} characters'}), 400
+
+            user_id = getattr(request, 'user_data', {}).get('user_id', '')
+            key = f'{user_id}:{request.method}:{request.path}:{idempotency_key}'
+            fingerprint = hashlib.sha256(request.get_data()).hexdigest()
+
+            stored = self._cached(key)
+            if stored is not None:
+                self._record('cache_hits')
+                return self._replay(stored, fingerprint)
+            stored = self._load(key)
+            if stored is None:
+                if self._claim(key, fingerprint):
+                    return self._execute(f, key, args, kwargs)
+                stored = self._load(key)  # claimed by a concurrent retry
+                if stored is None:
+                    return jsonify({'message': f'A request with this {IDEMPOTENCY_HEADER} is still in progress'}), 409
+            self._record('db_hits')
+            return self._replay(stored, fingerprint)
+        return decorated
@@ -0,0 +1,179 @@
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from flask import Response, current_app, g, has_app_context, request
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram,
+                               generate_latest, multiprocess)
+from prometheus_client.core import GaugeMetricFamily
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Per-request instrumentation shared by the services: wall time, DB queries
+# (SQLAlchemy engine events, or record_query() around raw cursors) and outbound
+# HTTP spans, exposed on /metrics in the Prometheus text format. Under gunicorn set
+# PROMETHEUS_MULTIPROC_DIR so /metrics aggregates all workers. SLOW_REQUEST_MS > 0
+# logs every request at least that slow, with its queries and spans.
+
+REQUEST_ID_HEADER = 'X-Request-ID'
+SLOW_REQUEST_MS = float(os.environ.get('SLOW_REQUEST_MS', 0))
+
+REQUESTS = Counter('http_requests_total', 'Requests handled',
+                   ['service', 'method', 'endpoint', 'status'])
+REQUEST_SECONDS = Histogram('http_request_duration_seconds', 'Request wall time',
+                            ['service', 'method', 'endpoint'])
+DB_QUERIES = Counter('db_queries_total', 'Database queries', ['service', 'endpoint', 'driver'])
+DB_SECONDS = Counter('db_query_seconds_total', 'Time spent in database queries',
+                     ['service', 'endpoint', 'driver'])
+QUERIES_PER_REQUEST = Histogram('db_queries_per_request', 'Database queries per request',
+                                ['service', 'endpoint'], buckets=(0, 1, 2, 5, 10, 20, 50, 100, 500))
+HTTP_CALLS = Counter('http_client_requests_total', 'Outbound service calls',
+                     ['service', 'target', 'method', 'status'])
+HTTP_SECONDS = Histogram('http_client_request_duration_seconds', 'Outbound service call time, retries included',
+                         ['service', 'target', 'method'])
+
+
+class RequestStats:
+    def __init__(self, service, endpoint, request_id):
+        self.service = service
+        self.endpoint = endpoint
+        self.request_id = request_id
+        self.started = time.perf_counter()
+        self.db_queries = 0
+        self.db_seconds = 0.0
+        self.spans = []  # (method, url, status, seconds)
+        self._lock = threading.Lock()  # concurrent fan-out calls report from worker threads
+
+    def add_query(self, seconds):
+        with self._lock:
+            self.db_queries += 1
+            self.db_seconds += seconds
+
+    def add_span(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+
+_current = ContextVar('request_stats', default=None)
+_stats_providers = []  # (service, name, callable() -> dict)
+
+
+def current_request_id():
+    stats = _current.get()
+    return stats.request_id if stats is not None else None
+
+
+# Service and endpoint labels; work outside a request (outbox, startup) is 'background'
+def _labels():
+    stats = _current.get()
+    if stats is not None:
+        return stats, stats.service, stats.endpoint
+    service = current_app.config.get('METRICS_SERVICE', 'unknown') if has_app_context() else 'unknown'
+    return None, service, 'background'
+
+
+def observe_query(driver, seconds):
+    stats, service, endpoint = _labels()
+    if stats is not None:
+        stats.add_query(seconds)
+    DB_QUERIES.labels(service, endpoint, driver).inc()
+    DB_SECONDS.labels(service, endpoint, driver).inc(seconds)
+
+
+@contextmanager
+def record_query(driver):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_query(driver, time.perf_counter() - started)
+
+
+def record_http_call(target, method, url, status, seconds):
+    stats, service, _ = _labels()
+    if stats is not None:
+        stats.add_span((method, url, status, seconds))
+    HTTP_CALLS.labels(service, target, method, status).inc()
+    HTTP_SECONDS.labels(service, target, method).observe(seconds)
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info['query_started'] = time.perf_counter()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    observe_query(conn.engine.dialect.name, time.perf_counter() - conn.info.pop('query_started'))
+
+
+# Values of the registered stats callables (cache hit rates, pool usage, ...) as gauges
+class StatsCollector:
+    def collect(self):
+        for service, name, provider in list(_stats_providers):
+            for key, value in provider().items():
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                gauge = GaugeMetricFamily(f'{name}_{key}', f'{name} {key}', labels=['service', 'pid'])
+                gauge.add_metric([service, str(os.getpid())], value)
+                yield gauge
+
+
+_stats_collector = StatsCollector()
+if 'PROMETHEUS_MULTIPROC_DIR' not in os.environ:
+    REGISTRY.register(_stats_collector)
+
+
+def metrics():
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        registry.register(_stats_collector)
+    else:
+        registry = REGISTRY
+    return Response(generate_latest(registry), headers={'Content-Type': CONTENT_TYPE_LATEST})
+
+
+def _log_slow_request(stats, response, seconds):
+    spans = ', '.join(f'{method} {url} {status} {span * 1000:.0f}ms' for method, url, status, span in stats.spans)
+    current_app.logger.warning(
+        'Slow request %s %s %s %.0fms request_id=%s db=%d queries/%.0fms http=%d calls [%s]',
+        request.method, request.full_path.rstrip('?'), response.status_code, seconds * 1000,
+        stats.request_id, stats.db_queries, stats.db_seconds * 1000, len(stats.spans), spans)
+
+
+def init_instrumentation(app, service, stats=None):
+    app.config['METRICS_SERVICE'] = service
+    for name, provider in (stats or {}).items():
+        _stats_providers.append((service, name, provider))
+
+    @app.before_request
+    def start_request_stats():
+        endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+        request_id = request.headers.get(REQUEST_ID_HEADER) or uuid.uuid4().hex
+        g.request_stats_token = _current.set(RequestStats(service, endpoint, request_id))
+
+    @app.after_request
+    def finish_request_stats(response):
+        stats = _current.get()
+        if stats is None:
+            return response
+        seconds = time.perf_counter() - stats.started
+        REQUESTS.labels(service, request.method, stats.endpoint, response.status_code).inc()
+        REQUEST_SECONDS.labels(service, request.method, stats.endpoint).observe(seconds)
+        QUERIES_PER_REQUEST.labels(service, stats.endpoint).observe(stats.db_queries)
+        response.headers[REQUEST_ID_HEADER] = stats.request_id
+        if SLOW_REQUEST_MS and seconds * 1000 >= SLOW_REQUEST_MS:
+            _log_slow_request(stats, response, seconds)
+        return response
+
+    @app.teardown_request
+    def clear_request_stats(exc):
+        token = g.pop('request_stats_token', None)
+        if token is not None:
+            _current.reset(token)
+
+    app.add_url_rule('/metrics', 'metrics', metrics)
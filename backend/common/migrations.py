@@ -0,0 +1,44 @@
+from sqlalchemy import inspect
+from sqlalchemy.exc import IntegrityError, OperationalError
+
+# db.create_all() only creates missing tables; it never adds columns or indexes to a
+# table that already exists. ensure_columns() and ensure_indexes() bring existing
+# SQLite files up to the model definitions and are safe to run on every start.
+
+
+# New columns must be nullable or have a server_default to be added to existing rows
+def ensure_columns(engine, metadata):
+    inspector = inspect(engine)
+    compiler = engine.dialect.ddl_compiler(engine.dialect, None)
+    added = []
+    for table in metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            with engine.begin() as conn:
+                conn.exec_driver_sql(f'ALTER TABLE {compiler.preparer.format_table(table)} '
+                                     f'ADD COLUMN {compiler.get_column_specification(column)}')
+            added.append(f'{table.name}.{column.name}')
+    return added
+
+
+def ensure_indexes(engine, metadata):
+    inspector = inspect(engine)
+    created = []
+    for table in metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {ix['name'] for ix in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name in existing:
+                continue
+            try:
+                index.create(bind=engine)
+                created.append(index.name)
+            except (IntegrityError, OperationalError) as e:
+                # Typically a unique index over rows that already contain duplicates
+                print(f"Warning: Could not create index {index.name}: {e.orig}")
+    return created
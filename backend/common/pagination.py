@@ -0,0 +1,64 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+
+from sqlalchemy import and_, or_
+
+# Keyset (cursor) pagination over (created_at, id). The cursor is the position of the
+# last row of a page, so every page is an index range scan no matter how deep it is.
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 500
+
+
+class PaginationError(ValueError):
+    pass
+
+
+def encode_cursor(created_at, id):
+    raw = json.dumps([created_at.isoformat(), id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        created_at, id = json.loads(raw)
+        return datetime.fromisoformat(created_at), int(id)
+    except (binascii.Error, ValueError, TypeError):
+        raise PaginationError('Invalid cursor')
+
+
+def parse_limit(value, default=DEFAULT_LIMIT):
+    if value is None:
+        return default
+    try:
+        limit = int(value)
+    except ValueError:
+        raise PaginationError('limit must be an integer')
+    if limit < 1:
+        raise PaginationError('limit must be positive')
+    return min(limit, MAX_LIMIT)
+
+
+def parse_date(value, name):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d')
+    except ValueError:
+        raise PaginationError(f'{name} must be a date in YYYY-MM-DD format')
+
+
+# Returns (rows, next_cursor); next_cursor is None on the last page
+def paginate(query, model, cursor=None, limit=DEFAULT_LIMIT):
+    if cursor:
+        created_at, id = decode_cursor(cursor)
+        query = query.filter(or_(
+            model.created_at > created_at,
+            and_(model.created_at == created_at, model.id > id)
+        ))
+    rows = query.order_by(model.created_at, model.id).limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(rows[-1].created_at, rows[-1].id)
@@ -0,0 +1,46 @@
+from sqlalchemy import delete, insert, update
+from sqlalchemy.exc import IntegrityError
+
+# Incrementally maintained rollup tables, e.g. counts per (day, treatment, status).
+# Changes are applied as deltas in the caller's transaction, so a rollup commits or
+# rolls back together with the rows it counts. Dashboards then read a few rows per
+# day instead of scanning the raw tables.
+
+
+# deltas: {key tuple in primary key column order: {column: delta}}
+def add_delta(deltas, key, **values):
+    bucket = deltas.setdefault(key, {})
+    for name, value in values.items():
+        bucket[name] = bucket.get(name, 0) + value
+
+
+# A missing bucket is inserted; when a concurrent request inserted it first, the
+# delta is applied as an update instead
+def apply_deltas(session, model, deltas):
+    keys = [column.name for column in model.__table__.primary_key.columns]
+    for key, values in deltas.items():
+        values = {name: value for name, value in values.items() if value}
+        if not values:
+            continue
+        bump = (update(model)
+                .where(*(getattr(model, name) == value for name, value in zip(keys, key)))
+                .values({name: getattr(model, name) + value for name, value in values.items()}))
+        if session.execute(bump).rowcount == 0:
+            try:
+                with session.begin_nested():
+                    session.add(model(**dict(zip(keys, key)), **values))
+            except IntegrityError:
+                session.execute(bump)
+
+
+# Backfill: replace the whole rollup with the result of a grouped select whose
+# columns are in the order of `columns`. Commits, or rolls back and re-raises.
+def rebuild_rollup(session, model, columns, grouped_select):
+    try:
+        session.execute(delete(model))
+        session.execute(insert(model).from_select(columns, grouped_select))
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    return session.query(model).count()
@@ -0,0 +1,162 @@
+import asyncio
+import contextvars
+import functools
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from common.instrumentation import REQUEST_ID_HEADER, current_request_id, record_http_call
+
+# Shared HTTP client for service-to-service calls: one keep-alive
+# connection pool per host, timeouts, bounded retries and a circuit breaker.
+
+DEFAULT_TIMEOUT = (1.0, 5.0)  # (connect, read) seconds
+RETRY_METHODS = {'GET', 'HEAD', 'PUT', 'DELETE', 'OPTIONS'}
+RETRY_STATUSES = {502, 503, 504}
+FANOUT_CHUNK_SIZE = int(os.environ.get('FANOUT_CHUNK_SIZE', 100))
+
+# Threads that run the blocking calls behind the async variants, shared by all clients
+_executor = ThreadPoolExecutor(max_workers=int(os.environ.get('FANOUT_WORKERS', 16)),
+                               thread_name_prefix='service-client')
+
+
+class CircuitOpenError(requests.ConnectionError):
+    pass
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state()
+
+    def _state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half-open'
+        return 'open'
+
+    def allow_request(self):
+        # While half-open every caller may probe; the first result decides
+        with self._lock:
+            return self._state() != 'open'
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._state() == 'half-open' or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+class ServiceClient:
+    def __init__(self, base_url, timeout=DEFAULT_TIMEOUT, retries=2, backoff=0.1,
+                 pool_size=20, failure_threshold=5, reset_timeout=30):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def request(self, method, path, idempotent=None, **kwargs):
+        method = method.upper()
+        if idempotent is None:
+            idempotent = method in RETRY_METHODS
+        attempts = self.retries + 1 if idempotent else 1
+        kwargs.setdefault('timeout', self.timeout)
+        url = self.base_url + path
+        request_id = current_request_id()
+        if request_id:
+            kwargs['headers'] = {**(kwargs.get('headers') or {}), REQUEST_ID_HEADER: request_id}
+
+        started = time.perf_counter()
+        status = 'error'
+        try:
+            response = self._send(method, url, attempts, **kwargs)
+            status = response.status_code
+            return response
+        finally:
+            record_http_call(self.base_url, method, url, status, time.perf_counter() - started)
+
+    def _send(self, method, url, attempts, **kwargs):
+        for attempt in range(attempts):
+            if not self.breaker.allow_request():
+                raise CircuitOpenError(f'Circuit open for {self.base_url}')
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                self.breaker.record_failure()
+                if attempt == attempts - 1:
+                    raise
+            else:
+                if response.status_code not in RETRY_STATUSES:
+                    self.breaker.record_success()
+                    return response
+                self.breaker.record_failure()
+                if attempt == attempts - 1:
+                    return response
+            # Exponential backoff with full jitter
+            time.sleep(random.uniform(0, self.backoff * (2 ** attempt)))
+
+    def get(self, path, **kwargs):
+        return self.request('GET', path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request('POST', path, **kwargs)
+
+    # Async variants, so several calls can be awaited at once with asyncio.gather. Each call
+    # still goes through the pooled session (retries, breaker) on a shared worker thread,
+    # in a copy of the caller's context so the request id and spans follow it.
+    async def arequest(self, method, path, **kwargs):
+        loop = asyncio.get_running_loop()
+        call = functools.partial(contextvars.copy_context().run, self.request, method, path, **kwargs)
+        return await loop.run_in_executor(_executor, call)
+
+    async def aget(self, path, **kwargs):
+        return await self.arequest('GET', path, **kwargs)
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+# One client (and therefore one connection pool) per base URL per process
+def get_client(base_url, **kwargs):
+    with _clients_lock:
+        client = _clients.get(base_url)
+        if client is None:
+            client = ServiceClient(base_url, **kwargs)
+            _clients[base_url] = client
+        return client
+
+
+# Split ids into chunks, run the coroutine fetch(chunk) -> dict for all chunks
+# concurrently and merge the results
+async def gather_chunks(fetch, ids, chunk_size=FANOUT_CHUNK_SIZE):
+    ids = list(ids)
+    chunks = [ids[i:i + chunk_size] for i in range(0, len(ids), chunk_size)]
+    merged = {}
+    for result in await asyncio.gather(*(fetch(chunk) for chunk in chunks)):
+        merged.update(result)
+    return merged
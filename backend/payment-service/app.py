@@ -1,23 +1,42 @@
 from flask import Flask, request, jsonify
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import case, delete, func, insert, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload
+from sqlalchemy.orm.exc import StaleDataError
 from flask_cors import CORS
+import asyncio
 import os
+import sys
 import requests
-from datetime import datetime
-import jwt
-from functools import wraps
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.auth import auth_stats, service_token, token_required
+from common.bulk import BULK_CHUNK_SIZE, BulkError, bulk_summary, read_bulk_rows
+from common.db import configure_database
+from common.export import chunked, ndjson_response, wants_ndjson
+from common.idempotency import IdempotencyStore
+from common.instrumentation import init_instrumentation
+from common.migrations import ensure_columns, ensure_indexes
+from common.pagination import PaginationError, paginate, parse_date, parse_limit
+from common.rollups import add_delta, apply_deltas, rebuild_rollup
+from common.service_client import gather_chunks, get_client
 
 app = Flask(__name__)
 CORS(app)
 
 # Database configuration
 basedir = os.path.abspath(os.path.dirname(__file__))
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(basedir, 'payment.db')
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['SECRET_KEY'] = 'your-secret-key'  # Change this in production
+configure_database(app, 'payment', os.path.join(basedir, 'payment.db'))
+app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'your-secret-key')  # Change this in production
+PORT = int(os.environ.get('PORT', 5004))
 
 db = SQLAlchemy(app)
 
+# Downstream services
+appointment_service = get_client(os.environ.get('APPOINTMENT_SERVICE_URL', 'http://localhost:5003'))
+
 # Models
 class Payment(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -29,66 +48,214 @@ class Payment(db.Model):
     transaction_id = db.Column(db.String(100), unique=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Optimistic concurrency: every UPDATE checks and bumps it, so of two concurrent
+    # state transitions only the first commits; the other raises StaleDataError
+    version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
 
-# Authentication decorator
-def token_required(f):
-    @wraps(f)
-    def decorated(*args, **kwargs):
-        token = None
-        if 'Authorization' in request.headers:
-            token = request.headers['Authorization'].split(" ")[1]
+    __mapper_args__ = {'version_id_col': version}
+    __table_args__ = (
+        db.Index('ix_payment_user_created_at_id', 'user_id', 'created_at', 'id'),
+        db.Index('ix_payment_user_status', 'user_id', 'status'),
+        db.Index('uq_payment_appointment_id', 'appointment_id', unique=True),
+    )
 
-        if not token:
-            return jsonify({'message': 'Token is missing!'}), 401
+    projection = db.relationship(
+        'AppointmentProjection',
+        primaryjoin='foreign(Payment.appointment_id) == AppointmentProjection.appointment_id',
+        uselist=False, viewonly=True
+    )
 
-        try:
-            data = jwt.decode(token, app.config['SECRET_KEY'], algorithms=["HS256"])
-            request.user_data = data
-        except jwt.ExpiredSignatureError:
-            return jsonify({'message': 'Token has expired!'}), 401
-        except jwt.InvalidTokenError:
-            return jsonify({'message': 'Token is invalid!'}), 401
+# Local copy of what the invoice and history listings show about an appointment, so they
+# are one join instead of calls to the appointment service. Fed by the appointment
+# events and the treatment service's change notifications; `flask --app app
+# rebuild-projection` recreates it from the appointment service.
+class AppointmentProjection(db.Model):
+    appointment_id = db.Column(db.Integer, primary_key=True)
+    treatment_id = db.Column(db.Integer, index=True)
+    treatment_name = db.Column(db.String(100))
+    price = db.Column(db.Float)
+    appointment_date = db.Column(db.Date)
+    deleted = db.Column(db.Boolean, nullable=False, default=False)
+    event_id = db.Column(db.Integer)  # outbox id of the last applied event; older redeliveries are ignored
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+# Payments per (day, treatment, status) for GET /payments/summary, updated in the same
+# transaction as every invoice and payment change; `flask --app app backfill-rollups`
+# recomputes it. Pending invoices count on the day they were issued, processed ones on
+# the day they were processed. treatment_id 0 means the treatment isn't known here.
+class PaymentRollup(db.Model):
+    day = db.Column(db.Date, primary_key=True)
+    treatment_id = db.Column(db.Integer, primary_key=True)
+    status = db.Column(db.String(20), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    amount = db.Column(db.Float, nullable=False, default=0)
+
+def payment_rollup_key(status, created_at, updated_at, treatment_id):
+    day = created_at if status == 'pending' else updated_at
+    return (day.date(), treatment_id or 0, status)
+
+# Stored responses for Idempotency-Key retries (common/idempotency.py)
+class IdempotencyRecord(db.Model):
+    key = db.Column(db.String(255), primary_key=True)
+    fingerprint = db.Column(db.String(64), nullable=False)
+    status_code = db.Column(db.Integer)  # NULL while the first request is still running
+    body = db.Column(db.Text)
+    mimetype = db.Column(db.String(100))
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
 
-        return f(*args, **kwargs)
-    return decorated
+idempotency = IdempotencyStore(db, IdempotencyRecord,
+                               ttl=int(os.environ.get('IDEMPOTENCY_TTL', 86400)),
+                               maxsize=int(os.environ.get('IDEMPOTENCY_CACHE_SIZE', 10000)))
+init_instrumentation(app, 'payment', stats={'auth': auth_stats, 'idempotency': idempotency.stats})
 
 # Helper function to get appointment details
 def get_appointment_details(appointment_id):
     try:
-        response = requests.get(f'http://localhost:5003/appointments/{appointment_id}', 
-                              headers={'Authorization': request.headers.get('Authorization')})
+        response = appointment_service.get(f'/appointments/{appointment_id}',
+                                           headers={'Authorization': request.headers.get('Authorization')})
         if response.status_code == 200:
             return response.json()
         return None
-    except:
+    except requests.RequestException:
         return None
 
-# Webhook endpoint to receive appointment confirmation
+# Helper function to get many appointments, keyed by id: the ids are looked up
+# in chunks of FANOUT_CHUNK_SIZE, all chunks concurrently. Failed chunks are left
+# out unless raise_errors is set.
+async def get_appointments_details_async(appointment_ids, headers=None, raise_errors=False):
+    headers = headers or {'Authorization': request.headers.get('Authorization')}
+
+    async def fetch(chunk):
+        try:
+            response = await appointment_service.aget('/appointments',
+                                                      params={'ids': ','.join(str(i) for i in chunk)},
+                                                      headers=headers)
+            response.raise_for_status()
+        except requests.RequestException:
+            if raise_errors:
+                raise
+            return {}
+        return {a['id']: a for a in response.json()}
+
+    return await gather_chunks(fetch, sorted(set(appointment_ids)))
+
+# Price of an appointment event. New events carry a price snapshot; older ones
+# fall back to asking the appointment service. Returns (price, error, status_code).
+def resolve_event_price(event):
+    if event.get('price') is not None:
+        return float(event['price']), None, None
+
+    appointment = get_appointment_details(event['appointment_id'])
+    if not appointment:
+        return None, 'Appointment not found', 404
+
+    treatment = appointment.get('treatment')
+    if not treatment or treatment.get('harga') is None:
+        return None, 'Treatment details not available', 400
+    return float(treatment['harga']), None, None
+
+# Projection rows of a batch of events, keyed by appointment id, in one query
+def load_projections(events):
+    appointment_ids = {e['appointment_id'] for e in events}
+    return {p.appointment_id: p for p in
+            AppointmentProjection.query.filter(AppointmentProjection.appointment_id.in_(appointment_ids))}
+
+# Apply an appointment event to the projection, in the caller's transaction. Events
+# without an outbox id (direct webhook calls) only fill in a missing row. projections
+# comes from load_projections() and picks up the rows created here, so later events
+# of the same batch see them.
+def apply_appointment_event(event, projections):
+    appointment_id = event['appointment_id']
+    event_id = event.get('event_id')
+    projection = projections.get(appointment_id)
+    if projection is not None and (event_id is None or (projection.event_id or 0) >= event_id):
+        return
+    if event.get('event_type') == 'appointment.deleted':
+        if projection is None:
+            projection = projections[appointment_id] = AppointmentProjection(appointment_id=appointment_id)
+            db.session.add(projection)
+        projection.deleted = True
+        projection.event_id = event_id
+        return
+    if projection is None:
+        if not event.get('appointment_date'):
+            return  # not enough to show it; the listings look it up until the next rebuild
+        projection = projections[appointment_id] = AppointmentProjection(appointment_id=appointment_id)
+        db.session.add(projection)
+    if 'treatment_id' in event:
+        projection.treatment_id = event['treatment_id']
+    if 'treatment_name' in event:
+        projection.treatment_name = event['treatment_name']
+    if event.get('price') is not None:
+        projection.price = float(event['price'])
+    if event.get('appointment_date'):
+        projection.appointment_date = datetime.strptime(event['appointment_date'], '%Y-%m-%d').date()
+    projection.deleted = False
+    projection.event_id = event_id
+
+# Create pending invoices for many appointment events with one lookup and one commit
+def create_invoices(events):
+    appointment_ids = [e['appointment_id'] for e in events]
+    existing = {appointment_id for (appointment_id,) in
+                db.session.query(Payment.appointment_id).filter(Payment.appointment_id.in_(appointment_ids))}
+
+    projections = load_projections(events)
+    created, skipped, failed = [], [], []
+    for event in events:
+        apply_appointment_event(event, projections)
+        appointment_id = event['appointment_id']
+        if appointment_id in existing:
+            skipped.append(event)
+            continue
+        price, error, _ = resolve_event_price(event)
+        if error:
+            failed.append(dict(event, error=error))
+            continue
+        existing.add(appointment_id)
+        created.append((Payment(
+            user_id=event['user_id'],
+            appointment_id=appointment_id,
+            amount=price,
+            status='pending'
+        ), event.get('treatment_id')))
+
+    db.session.add_all(payment for payment, _ in created)
+    db.session.flush()
+    deltas = {}
+    for payment, treatment_id in created:
+        add_delta(deltas, payment_rollup_key(payment.status, payment.created_at, payment.updated_at, treatment_id),
+                  count=1, amount=payment.amount)
+    apply_deltas(db.session, PaymentRollup, deltas)
+    db.session.commit()
+    return [payment for payment, _ in created], skipped, failed
+
+# Webhook endpoint to receive appointment confirmation, accepts one event or a list of events.
+# The event's price and user_id are trusted, so only the appointment service may call it.
 @app.route('/webhook/appointment-confirmed', methods=['POST'])
 @token_required
 def handle_appointment_confirmed():
-    data = request.get_json()
-    if not data or 'appointment_id' not in data:
-        return jsonify({'message': 'Appointment ID is required'}), 400
+    if request.user_data['role'] != 'service':
+        return jsonify({'message': 'Unauthorized access'}), 403
 
-    appointment_id = data['appointment_id']
-    user_id = data.get('user_id') or request.user_data['user_id']  # Fallback to authenticated user
+    data = request.get_json()
+    if isinstance(data, list):
+        return handle_appointment_confirmed_batch(data)
 
-    # Get appointment details
-    appointment = get_appointment_details(appointment_id)
-    if not appointment:
-        return jsonify({'message': 'Appointment not found'}), 404
+    if not data or 'appointment_id' not in data or not data.get('user_id'):
+        return jsonify({'message': 'Appointment ID and user ID are required'}), 400
 
-    treatment = appointment.get('treatment')
-    if not treatment:
-        return jsonify({'message': 'Treatment details not available'}), 400
+    appointment_id = data['appointment_id']
+    user_id = data['user_id']
 
-    # Extract price from treatment (assuming price is in treatment data)
-    price = float(treatment.get('price', '150000').replace('Rp ', '').replace('.', ''))  # Default to 150000 if not found
+    price, error, status_code = resolve_event_price(data)
+    if error:
+        return jsonify({'message': error}), status_code
 
+    apply_appointment_event(data, load_projections([data]))
     # Check if invoice already exists
     existing_payment = Payment.query.filter_by(appointment_id=appointment_id).first()
     if existing_payment:
+        db.session.commit()
         return jsonify({'message': 'Invoice already exists for this appointment'}), 200
 
     try:
@@ -100,6 +267,11 @@ def handle_appointment_confirmed():
             status='pending'
         )
         db.session.add(payment)
+        db.session.flush()
+        apply_deltas(db.session, PaymentRollup, {
+            payment_rollup_key(payment.status, payment.created_at, payment.updated_at, data.get('treatment_id')):
+                {'count': 1, 'amount': payment.amount}
+        })
         db.session.commit()
 
         return jsonify({
@@ -111,10 +283,93 @@ def handle_appointment_confirmed():
                 'status': payment.status
             }
         }), 201
+    except IntegrityError:
+        # A concurrent delivery of the same event won the unique appointment_id index
+        db.session.rollback()
+        return jsonify({'message': 'Invoice already exists for this appointment'}), 200
     except Exception as e:
         db.session.rollback()
         return jsonify({'message': f'Error creating invoice: {str(e)}'}), 500
 
+def handle_appointment_confirmed_batch(events):
+    invalid = [e for e in events if not isinstance(e, dict) or 'appointment_id' not in e or not e.get('user_id')]
+    if invalid:
+        return jsonify({'message': 'Appointment ID and user ID are required for every event'}), 400
+
+    try:
+        created, skipped, failed = create_invoices(events)
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'message': f'Error creating invoices: {str(e)}'}), 500
+
+    return jsonify({
+        'message': f'{len(created)} invoices created',
+        'created': [p.appointment_id for p in created],
+        'skipped': [e['appointment_id'] for e in skipped],
+        'failed': failed
+    }), 201 if created else 200
+
+# Appointment updates and deletions from the appointment service's outbox; they only
+# refresh the projection
+@app.route('/webhook/appointment-changed', methods=['POST'])
+@token_required
+def handle_appointment_changed():
+    if request.user_data['role'] != 'service':
+        return jsonify({'message': 'Unauthorized access'}), 403
+
+    events = request.get_json()
+    if not isinstance(events, list) or any(not isinstance(e, dict) or 'appointment_id' not in e for e in events):
+        return jsonify({'message': 'A list of events with an appointment ID each is required'}), 400
+
+    try:
+        projections = load_projections(events)
+        for event in events:
+            apply_appointment_event(event, projections)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'message': f'Error applying events: {str(e)}'}), 500
+    return jsonify({'message': f'{len(events)} events applied', 'failed': []})
+
+# Called by the treatment service whenever a treatment is updated or deleted
+@app.route('/internal/projection/treatment-changed', methods=['POST'])
+@token_required
+def handle_treatment_changed():
+    if request.user_data['role'] != 'service':
+        return jsonify({'message': 'Unauthorized access'}), 403
+
+    data = request.get_json(silent=True) or {}
+    if data.get('treatment_id') is None:
+        return jsonify({'message': 'treatment_id is required'}), 400
+    treatment = data.get('treatment')
+    db.session.execute(update(AppointmentProjection)
+                       .where(AppointmentProjection.treatment_id == data['treatment_id'])
+                       .values(treatment_name=treatment.get('nama') if treatment else None))
+    db.session.commit()
+    return jsonify({'message': 'Projection updated'})
+
+# Treatment name and date per appointment id for a list of payments, from the projection
+# loaded with them. Appointments it doesn't cover yet are looked up in batched calls;
+# deleted ones are left out, as the appointment service no longer returns them.
+def appointment_summaries(payments):
+    summaries, missing = {}, []
+    for payment in payments:
+        projection = payment.projection
+        if projection is None:
+            missing.append(payment.appointment_id)
+        elif not projection.deleted:
+            summaries[payment.appointment_id] = {
+                'treatment': projection.treatment_name,
+                'appointment_date': projection.appointment_date.isoformat()
+            }
+    if missing:
+        for appointment_id, appointment in asyncio.run(get_appointments_details_async(missing)).items():
+            summaries[appointment_id] = {
+                'treatment': (appointment['treatment'] or {}).get('nama'),
+                'appointment_date': appointment['appointment_date']
+            }
+    return summaries
+
 # Endpoints
 @app.route('/payments/invoices', methods=['GET'])
 @token_required
@@ -122,21 +377,21 @@ def get_invoices():
     user_id = request.user_data['user_id']
     appointment_id = request.args.get('appointment_id')
 
-    query = Payment.query.filter_by(user_id=user_id, status='pending')
+    query = Payment.query.options(joinedload(Payment.projection)).filter_by(user_id=user_id, status='pending')
     if appointment_id:
         query = query.filter_by(appointment_id=appointment_id)
 
     payments = query.all()
-    
+    appointments = appointment_summaries(payments)
+
     result = []
     for payment in payments:
-        appointment = get_appointment_details(payment.appointment_id)
+        appointment = appointments.get(payment.appointment_id)
         if appointment:
             result.append({
                 'id': payment.id,
                 'appointment_id': payment.appointment_id,
-                'treatment': appointment['treatment']['name'],
-                'appointment_date': appointment['appointment_date'],
+                **appointment,
                 'amount': payment.amount,
                 'status': payment.status,
                 'created_at': payment.created_at.strftime('%Y-%m-%d %H:%M:%S')
@@ -144,32 +399,200 @@ def get_invoices():
     
     return jsonify(result)
 
-@app.route('/payments/history', methods=['GET'])
+# Raw payments for a set of appointments, e.g. GET /payments?appointment_ids=1,2,3 from
+# the appointment service's booking view. No enrichment, so no calls back out.
+@app.route('/payments', methods=['GET'])
 @token_required
-def get_payment_history():
-    user_id = request.user_data['user_id']
-    payments = Payment.query.filter_by(user_id=user_id).all()
-    
+def get_payments_by_appointment():
+    ids = request.args.get('appointment_ids')
+    if not ids:
+        return jsonify({'message': 'appointment_ids is required'}), 400
+    try:
+        id_list = [int(i) for i in ids.split(',') if i.strip()]
+    except ValueError:
+        return jsonify({'message': 'appointment_ids must be a comma separated list of integers'}), 400
+
+    query = Payment.query.filter(Payment.appointment_id.in_(id_list))
+    if request.user_data['role'] not in ('admin', 'service'):
+        query = query.filter(Payment.user_id == request.user_data['user_id'])
+    return jsonify([{
+        'id': payment.id,
+        'appointment_id': payment.appointment_id,
+        'amount': payment.amount,
+        'status': payment.status,
+        'payment_method': payment.payment_method,
+        'transaction_id': payment.transaction_id,
+        'created_at': payment.created_at.strftime('%Y-%m-%d %H:%M:%S')
+    } for payment in query.all()])
+
+# Payment history rows for a chunk of payments
+def serialize_payment_history(payments):
+    appointments = appointment_summaries(payments)
     result = []
     for payment in payments:
-        appointment = get_appointment_details(payment.appointment_id)
+        appointment = appointments.get(payment.appointment_id)
         if appointment:
             result.append({
                 'id': payment.id,
                 'appointment_id': payment.appointment_id,
-                'treatment': appointment['treatment']['name'],
-                'appointment_date': appointment['appointment_date'],
+                **appointment,
                 'amount': payment.amount,
                 'status': payment.status,
                 'payment_method': payment.payment_method,
                 'transaction_id': payment.transaction_id,
                 'created_at': payment.created_at.strftime('%Y-%m-%d %H:%M:%S')
             })
-    
-    return jsonify(result)
+    return result
+
+@app.route('/payments/history', methods=['GET'])
+@token_required
+def get_payment_history():
+    user_id = request.user_data['user_id']
+    query = Payment.query.options(joinedload(Payment.projection)).filter_by(user_id=user_id)
+    try:
+        limit = parse_limit(request.args.get('limit'))
+        if request.args.get('status'):
+            query = query.filter(Payment.status == request.args['status'])
+        if request.args.get('from'):
+            query = query.filter(Payment.created_at >= parse_date(request.args['from'], 'from'))
+        if request.args.get('to'):
+            query = query.filter(Payment.created_at < parse_date(request.args['to'], 'to') + timedelta(days=1))
+        if wants_ndjson():
+            return ndjson_response(query.order_by(Payment.created_at, Payment.id), serialize_payment_history)
+        payments, next_cursor = paginate(query, Payment, request.args.get('cursor'), limit)
+    except PaginationError as e:
+        return jsonify({'message': str(e)}), 400
+
+    return jsonify({'payments': serialize_payment_history(payments), 'next_cursor': next_cursor})
+
+# Payment counts and amounts per day, treatment and status from the rollup, so the cost
+# depends on the number of days asked for rather than the number of payments
+@app.route('/payments/summary', methods=['GET'])
+@token_required
+def get_payment_summary():
+    if request.user_data['role'] != 'admin':
+        return jsonify({'message': 'Unauthorized access'}), 403
+
+    query = PaymentRollup.query.filter(PaymentRollup.count != 0)  # buckets emptied by moves and deletions stay behind
+    try:
+        if request.args.get('from'):
+            query = query.filter(PaymentRollup.day >= parse_date(request.args['from'], 'from').date())
+        if request.args.get('to'):
+            query = query.filter(PaymentRollup.day <= parse_date(request.args['to'], 'to').date())
+    except PaginationError as e:
+        return jsonify({'message': str(e)}), 400
+    treatment_id = request.args.get('treatment_id', type=int)
+    if treatment_id is not None:
+        query = query.filter(PaymentRollup.treatment_id == treatment_id)
+    if request.args.get('status'):
+        query = query.filter(PaymentRollup.status == request.args['status'])
+
+    days, totals = [], {}
+    for row in query.order_by(PaymentRollup.day, PaymentRollup.treatment_id, PaymentRollup.status):
+        days.append({
+            'date': row.day.isoformat(),
+            'treatment_id': row.treatment_id,
+            'status': row.status,
+            'count': row.count,
+            'amount': row.amount
+        })
+        total = totals.setdefault(row.status, {'count': 0, 'amount': 0.0})
+        total['count'] += row.count
+        total['amount'] += row.amount
+    return jsonify({'days': days, 'totals': totals})
+
+PAYMENT_STATUSES = ('pending', 'completed', 'failed')
+
+# Validate one bulk row and return the column values to insert; raises ValueError
+def bulk_payment_values(row):
+    if not isinstance(row, dict):
+        raise ValueError('Row must be an object')
+    for field in ('user_id', 'appointment_id', 'amount'):
+        if row.get(field) in (None, ''):
+            raise ValueError(f'{field} is required')
+    status = row.get('status') or 'pending'
+    if status not in PAYMENT_STATUSES:
+        raise ValueError(f"status must be one of {', '.join(PAYMENT_STATUSES)}")
+    try:
+        appointment_id = int(row['appointment_id'])
+        amount = float(row['amount'])
+        created_at = datetime.fromisoformat(row['created_at']) if row.get('created_at') else datetime.utcnow()
+    except (ValueError, TypeError):
+        raise ValueError('appointment_id must be an integer, amount a number and created_at ISO 8601')
+    return {
+        'user_id': str(row['user_id']),
+        'appointment_id': appointment_id,
+        'amount': amount,
+        'status': status,
+        'payment_method': row.get('payment_method'),
+        'transaction_id': row.get('transaction_id'),
+        'created_at': created_at,
+        'updated_at': created_at
+    }
+
+# Import many payments (JSON array or NDJSON) in chunked transactions. Rows whose
+# appointment already has a payment, or whose transaction_id is taken, are rejected.
+@app.route('/payments/bulk', methods=['POST'])
+@token_required
+def bulk_create_payments():
+    if request.user_data['role'] != 'admin':
+        return jsonify({'message': 'Unauthorized access'}), 403
+    try:
+        rows, errors = read_bulk_rows()
+    except BulkError as e:
+        return jsonify({'message': str(e)}), 400
+
+    valid = []
+    for number, row in rows:
+        try:
+            valid.append((number, bulk_payment_values(row)))
+        except ValueError as e:
+            errors.append({'row': number, 'error': str(e)})
+
+    inserted = 0
+    for chunk in chunked(valid, BULK_CHUNK_SIZE):
+        appointment_ids = {values['appointment_id'] for _, values in chunk}
+        transaction_ids = {values['transaction_id'] for _, values in chunk if values['transaction_id']}
+        taken_appointments = {a for (a,) in db.session.query(Payment.appointment_id)
+                              .filter(Payment.appointment_id.in_(appointment_ids))}
+        taken_transactions = {t for (t,) in db.session.query(Payment.transaction_id)
+                              .filter(Payment.transaction_id.in_(transaction_ids))}
+
+        accepted = []
+        for number, values in chunk:
+            if values['appointment_id'] in taken_appointments:
+                errors.append({'row': number, 'error': 'Invoice already exists for this appointment'})
+            elif values['transaction_id'] and values['transaction_id'] in taken_transactions:
+                errors.append({'row': number, 'error': 'transaction_id already exists'})
+            else:
+                taken_appointments.add(values['appointment_id'])
+                if values['transaction_id']:
+                    taken_transactions.add(values['transaction_id'])
+                accepted.append((number, values))
+        if not accepted:
+            continue
+
+        treatments = dict(db.session.query(AppointmentProjection.appointment_id, AppointmentProjection.treatment_id)
+                          .filter(AppointmentProjection.appointment_id.in_(appointment_ids)))
+        deltas = {}
+        for _, values in accepted:
+            add_delta(deltas, payment_rollup_key(values['status'], values['created_at'], values['updated_at'],
+                                                 treatments.get(values['appointment_id'])),
+                      count=1, amount=values['amount'])
+        try:
+            db.session.execute(insert(Payment), [values for _, values in accepted])
+            apply_deltas(db.session, PaymentRollup, deltas)
+            db.session.commit()
+            inserted += len(accepted)
+        except Exception as e:
+            db.session.rollback()
+            errors.extend({'row': number, 'error': f'Insert failed: {e}'} for number, _ in accepted)
+
+    return jsonify(bulk_summary(inserted, errors)), 201 if inserted else 400
 
 @app.route('/payments/<int:id>/process', methods=['POST'])
 @token_required
+@idempotency.idempotent
 def process_payment(id):
     payment = Payment.query.get_or_404(id)
     
@@ -186,11 +609,18 @@ def process_payment(id):
     try:
         # Simulate payment processing
         import uuid
+        treatment_id = payment.projection.treatment_id if payment.projection else None
+        deltas = {}
+        add_delta(deltas, payment_rollup_key(payment.status, payment.created_at, payment.updated_at, treatment_id),
+                  count=-1, amount=-payment.amount)
         payment.status = 'completed'
         payment.payment_method = data['payment_method']
         payment.transaction_id = str(uuid.uuid4())
         payment.updated_at = datetime.utcnow()
-        
+        add_delta(deltas, payment_rollup_key(payment.status, payment.created_at, payment.updated_at, treatment_id),
+                  count=1, amount=payment.amount)
+        apply_deltas(db.session, PaymentRollup, deltas)
+
         db.session.commit()
         
         return jsonify({
@@ -204,11 +634,71 @@ def process_payment(id):
                 'transaction_id': payment.transaction_id
             }
         })
+    except StaleDataError:
+        db.session.rollback()
+        return jsonify({'message': 'Payment already processed'}), 409
     except Exception as e:
         db.session.rollback()
         return jsonify({'message': f'Error processing payment: {str(e)}'}), 500
 
+# One-shot schema setup: `flask --app app init-db`
+@app.cli.command('init-db')
+def init_db_command():
+    db.create_all()
+    ensure_columns(db.engine, db.metadata)
+    ensure_indexes(db.engine, db.metadata)
+    print('Payment database initialized')
+
+# Recompute the payment rollup from the payment table: `flask --app app backfill-rollups`
+@app.cli.command('backfill-rollups')
+def backfill_rollups_command():
+    day = case((Payment.status == 'pending', func.date(Payment.created_at)), else_=func.date(Payment.updated_at))
+    treatment_id = func.coalesce(AppointmentProjection.treatment_id, 0)
+    grouped = (db.select(day, treatment_id, Payment.status, func.count(), func.sum(Payment.amount))
+               .select_from(Payment)
+               .outerjoin(AppointmentProjection, AppointmentProjection.appointment_id == Payment.appointment_id)
+               .group_by(day, treatment_id, Payment.status))
+    buckets = rebuild_rollup(db.session, PaymentRollup, ['day', 'treatment_id', 'status', 'count', 'amount'], grouped)
+    print(f'Payment rollup backfilled: {buckets} buckets')
+
+# Recreate the appointment projection from the appointment service, e.g. after bulk
+# imports without events or missed notifications: `flask --app app rebuild-projection`.
+# Runs in one transaction, so the listings keep using the old rows until it commits.
+@app.cli.command('rebuild-projection')
+def rebuild_projection_command():
+    db.session.execute(delete(AppointmentProjection))
+    appointment_ids = db.session.scalars(db.select(Payment.appointment_id).order_by(Payment.appointment_id)).all()
+    rebuilt = 0
+    try:
+        for chunk in chunked(appointment_ids):
+            headers = {'Authorization': f'Bearer {service_token("payment-service")}'}
+            appointments = asyncio.run(get_appointments_details_async(chunk, headers, raise_errors=True))
+            rows = []
+            for appointment_id in chunk:
+                appointment = appointments.get(appointment_id)
+                if appointment is None:
+                    rows.append({'appointment_id': appointment_id, 'deleted': True})
+                    continue
+                treatment = appointment['treatment'] or {}
+                rows.append({
+                    'appointment_id': appointment_id,
+                    'treatment_id': treatment.get('id'),
+                    'treatment_name': treatment.get('nama'),
+                    'price': treatment.get('harga'),
+                    'appointment_date': datetime.strptime(appointment['appointment_date'], '%Y-%m-%d').date(),
+                    'deleted': False
+                })
+            db.session.execute(insert(AppointmentProjection), rows)
+            rebuilt += len(rows)
+        db.session.commit()
+    except requests.RequestException as e:
+        db.session.rollback()
+        raise SystemExit(f'Projection rebuild failed, nothing changed: {e}')
+    print(f'Appointment projection rebuilt: {rebuilt} appointments')
+
+def create_app():
+    return app
+
 if __name__ == '__main__':
-    with app.app_context():
-        db.create_all()
-    app.run(debug=True, port=5004)
\ No newline at end of file
+    # Development server; production runs `gunicorn wsgi:application` (gunicorn.conf.py)
+    create_app().run(debug=True, port=PORT)
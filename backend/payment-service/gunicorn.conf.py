@@ -0,0 +1,17 @@
+# Read by `gunicorn wsgi:application` when started from this directory
+import multiprocessing
+import os
+
+bind = f"{os.environ.get('HOST', '0.0.0.0')}:{os.environ.get('PORT', 5004)}"
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG')
+
+
+# With PROMETHEUS_MULTIPROC_DIR set, /metrics sums the workers' metric files; drop a dead worker's gauges
+def child_exit(server, worker):
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
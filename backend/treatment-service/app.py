@@ -1,15 +1,35 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, abort
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
 import os
+import sys
+import requests
+import hashlib
+from catalog_cache import CatalogCache
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.auth import service_token
+from common.db import configure_database
+from common.instrumentation import init_instrumentation
+from common.service_client import get_client
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS
 basedir = os.path.abspath(os.path.dirname(__file__))
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(basedir, 'treatment.db')
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+configure_database(app, 'treatment', os.path.join(basedir, 'treatment.db'))
+app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'your-secret-key')  # Change this in production
+PORT = int(os.environ.get('PORT', 5002))  # the port the other services call
 
 db = SQLAlchemy(app)
+init_instrumentation(app, 'treatment')
+
+# Services that cache or project treatment rows and must be told when one changes
+TREATMENT_CHANGE_SUBSCRIBERS = [
+    (get_client(os.environ.get('APPOINTMENT_SERVICE_URL', 'http://localhost:5003')),
+     '/internal/treatment-cache/invalidate'),
+    (get_client(os.environ.get('PAYMENT_SERVICE_URL', 'http://localhost:5004')),
+     '/internal/projection/treatment-changed')
+]
 
 # Model
 class Treatment(db.Model):
@@ -38,26 +58,58 @@ def seed_data():
             db.session.add(treatment)
         db.session.commit()
 
+# Publish a change to every subscriber with the new values (None once deleted),
+# failures are only logged
+def publish_change(treatment_id, treatment=None):
+    headers = {'Authorization': f'Bearer {service_token("treatment-service")}'}
+    for client, path in TREATMENT_CHANGE_SUBSCRIBERS:
+        try:
+            client.post(path, json={'treatment_id': treatment_id, 'treatment': treatment},
+                        headers=headers, idempotent=True)
+        except requests.RequestException as e:
+            print(f"Warning: Failed to publish treatment change to {client.base_url}: {e}")
+
+def serialize_treatment(treatment):
+    return {
+        'id': treatment.id,
+        'nama': treatment.nama,
+        'nama_dokter': treatment.nama_dokter,
+        'harga': treatment.harga
+    }
+
+def load_catalog():
+    return [serialize_treatment(t) for t in Treatment.query.order_by(Treatment.id).all()]
+
+catalog = CatalogCache(load_catalog, max_age=int(os.environ.get('CATALOG_MAX_AGE', 30)))
+
+# Serve a pre-serialized body with a strong ETag; a matching If-None-Match gets a 304
+def catalog_response(body, etag):
+    response = app.response_class(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
 # Endpoint CRUD
 @app.route('/treatments', methods=['GET'])
 def get_all_treatments():
-    treatments = Treatment.query.all()
-    return jsonify([{
-        'id': t.id,
-        'nama': t.nama,
-        'nama_dokter': t.nama_dokter,
-        'harga': t.harga
-    } for t in treatments])
+    snapshot = catalog.snapshot()
+    # Optional ?ids=1,2,3 to fetch several treatments in one call
+    ids = request.args.get('ids')
+    if ids:
+        try:
+            id_list = sorted({int(i) for i in ids.split(',') if i.strip()})
+        except ValueError:
+            return jsonify({'message': 'ids must be a comma separated list of integers'}), 400
+        body = '[' + ','.join(snapshot['items'][i][0] for i in id_list if i in snapshot['items']) + ']'
+        return catalog_response(body, hashlib.sha1(body.encode()).hexdigest())
+    return catalog_response(*snapshot['list'])
 
 @app.route('/treatments/<int:id>', methods=['GET'])
 def get_treatment(id):
-    treatment = Treatment.query.get_or_404(id)
-    return jsonify({
-        'id': treatment.id,
-        'nama': treatment.nama,
-        'nama_dokter': treatment.nama_dokter,
-        'harga': treatment.harga
-    })
+    item = catalog.snapshot()['items'].get(id)
+    if item is None:
+        abort(404)
+    return catalog_response(*item)
 
 @app.route('/treatments', methods=['POST'])
 def add_treatment():
@@ -69,6 +121,8 @@ def add_treatment():
     )
     db.session.add(treatment)
     db.session.commit()
+    catalog.bump()
+    publish_change(treatment.id, serialize_treatment(treatment))
     return jsonify({'message': 'Treatment added successfully'}), 201
 
 @app.route('/treatments/<int:id>', methods=['PUT'])
@@ -79,6 +133,8 @@ def update_treatment(id):
     treatment.nama_dokter = data.get('nama_dokter', treatment.nama_dokter)
     treatment.harga = data.get('harga', treatment.harga)
     db.session.commit()
+    catalog.bump()
+    publish_change(id, serialize_treatment(treatment))
     return jsonify({'message': 'Treatment updated successfully'})
 
 @app.route('/treatments/<int:id>', methods=['DELETE'])
@@ -86,10 +142,21 @@ def delete_treatment(id):
     treatment = Treatment.query.get_or_404(id)
     db.session.delete(treatment)
     db.session.commit()
+    catalog.bump()
+    publish_change(id)
     return jsonify({'message': 'Treatment deleted successfully'})
 
+# One-shot schema setup and seed data: `flask --app app init-db`
+@app.cli.command('init-db')
+def init_db_command():
+    db.create_all()
+    seed_data()
+    print('Treatment database initialized')
+
+def create_app():
+    return app
+
 if __name__ == '__main__':
-    with app.app_context():
-        db.create_all()
-        seed_data()
-    app.run(debug=True) 
\ No newline at end of file
+    # Development server; production runs `gunicorn wsgi:application` (gunicorn.conf.py)
+    create_app().run(debug=True, port=PORT)
+ 
\ No newline at end of file
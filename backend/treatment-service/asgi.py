@@ -0,0 +1,5 @@
+# ASGI entry point, e.g. `uvicorn asgi:application --port 5002 --workers 4`
+from app import create_app
+from common.asgi import asgi_app
+
+application = asgi_app(create_app())
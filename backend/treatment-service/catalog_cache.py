@@ -0,0 +1,51 @@
+import hashlib
+import json
+import threading
+import time
+
+
+def _etag(body):
+    return hashlib.sha1(body.encode()).hexdigest()
+
+
+# Pre-serialized treatment catalog. Writes in this process bump the version and the
+# next read rebuilds the snapshot; max_age bounds how long a snapshot may miss writes
+# made by other worker processes.
+class CatalogCache:
+    def __init__(self, loader, max_age=30):
+        self.loader = loader  # callable() -> list of treatment dicts
+        self.max_age = max_age
+        self.version = 0
+        self._snapshot = None
+        self._lock = threading.Lock()
+
+    def bump(self):
+        with self._lock:
+            self.version += 1
+            self._snapshot = None
+
+    def snapshot(self):
+        snapshot = self._snapshot
+        if snapshot is not None and time.monotonic() - snapshot['built_at'] < self.max_age:
+            return snapshot
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is None or time.monotonic() - snapshot['built_at'] >= self.max_age:
+                snapshot = self._build()
+                self._snapshot = snapshot
+            return snapshot
+
+    def _build(self):
+        treatments = self.loader()
+        items = {}
+        for treatment in treatments:
+            body = json.dumps(treatment)
+            items[treatment['id']] = (body, _etag(body))
+        body = json.dumps(treatments)
+        return {
+            'version': self.version,
+            'built_at': time.monotonic(),
+            'treatments': treatments,
+            'list': (body, _etag(body)),
+            'items': items
+        }
@@ -4,53 +4,81 @@ import jwt
 import datetime
 import pymysql.cursors
 import os
+import sys
 from flask_cors import CORS # Tambahkan import CORS
+from db_pool import ConnectionPool
+from passwords import HashingPool, HashingPoolBusy
+from profile_cache import make_profile_cache
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.auth import auth_stats, token_required
+from common.instrumentation import init_instrumentation, record_query
 
 app = Flask(__name__)
-app.config['SECRET_KEY'] = 'GlowCare'
+app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'GlowCare')
+PORT = int(os.environ.get('PORT', 5001))
 
 # Inisialisasi CORS. Izinkan semua origin (untuk pengembangan).
 # Untuk produksi, ganti "*" dengan daftar origin frontend Anda.
 CORS(app) 
 
+# DictCursor yang mencatat jumlah dan durasi query untuk /metrics
+class InstrumentedCursor(pymysql.cursors.DictCursor):
+    def execute(self, query, args=None):
+        with record_query('pymysql'):
+            return super().execute(query, args)
+
 DB_CONFIG = {
-    'host': '127.0.0.1',
-    'user': 'root',
-    'password': '',
-    'db': 'user_service_db',
+    'host': os.environ.get('USER_DB_HOST', '127.0.0.1'),
+    'port': int(os.environ.get('USER_DB_PORT', 3306)),
+    'user': os.environ.get('USER_DB_USER', 'root'),
+    'password': os.environ.get('USER_DB_PASSWORD', ''),
+    'db': os.environ.get('USER_DB_NAME', 'user_service_db'),
     'charset': 'utf8mb4',
-    'cursorclass': pymysql.cursors.DictCursor
+    'cursorclass': InstrumentedCursor
 }
 
+# Koneksi dipakai ulang lewat pool; connection.close() mengembalikannya ke pool
+db_pool = ConnectionPool(
+    lambda: pymysql.connect(**DB_CONFIG),
+    pool_size=int(os.environ.get('DB_POOL_SIZE', 5)),
+    max_overflow=int(os.environ.get('DB_POOL_MAX_OVERFLOW', 10)),
+    timeout=float(os.environ.get('DB_POOL_TIMEOUT', 5)),
+    max_lifetime=int(os.environ.get('DB_POOL_MAX_LIFETIME', 3600))
+)
+
+# Cache profil per username. Default: LRU per proses; set PROFILE_CACHE_URL (Redis) kalau
+# ada beberapa worker, supaya edit profil di satu worker langsung terlihat di semua worker.
+profile_cache = make_profile_cache(
+    os.environ.get('PROFILE_CACHE_URL'),
+    maxsize=int(os.environ.get('PROFILE_CACHE_SIZE', 10000)),
+    ttl=int(os.environ.get('PROFILE_CACHE_TTL', 60))
+)
+
+# Hash password (PBKDF2) dijalankan di pool terbatas. Default: jatah core per proses
+# (CPU / WEB_CONCURRENCY) untuk hashing, dan paling banyak GUNICORN_THREADS - 1 request
+# register/login sekaligus; sisanya langsung dijawab 503, jadi selalu ada thread untuk
+# endpoint lain (mis. /api/profile) walau sedang ada badai login.
+cpu_count = os.cpu_count() or 1
+hashing_pool = HashingPool(
+    int(os.environ.get('PASSWORD_HASH_ITERATIONS', 600000)),
+    workers=int(os.environ.get('PASSWORD_HASH_WORKERS', 0))
+    or cpu_count // int(os.environ.get('WEB_CONCURRENCY', cpu_count)),
+    max_in_flight=int(os.environ.get('PASSWORD_HASH_MAX_IN_FLIGHT', 0))
+    or int(os.environ.get('GUNICORN_THREADS', 4)) - 1
+)
+init_instrumentation(app, 'user', stats={'auth': auth_stats, 'db_pool': db_pool.stats,
+                                         'profile_cache': profile_cache.stats,
+                                         'password_hashing': hashing_pool.stats})
+
 def get_db_connection():
     try:
-        connection = pymysql.connect(**DB_CONFIG)
+        connection = db_pool.acquire()
         return connection
     except Exception as e:
         print(f"Error connecting to database: {e}")
         return None
 
-def token_required(f):
-    @wraps(f)
-    def decorated(*args, **kwargs):
-        token = None
-        if 'Authorization' in request.headers:
-            token = request.headers['Authorization'].split(" ")[1]
-
-        if not token:
-            return jsonify({'message': 'Token is missing!'}), 401
-
-        try:
-            data = jwt.decode(token, app.config['SECRET_KEY'], algorithms=["HS256"])
-            request.user_data = data
-        except jwt.ExpiredSignatureError:
-            return jsonify({'message': 'Token has expired!'}), 401
-        except jwt.InvalidTokenError:
-            return jsonify({'message': 'Token is invalid!'}), 401
-
-        return f(*args, **kwargs)
-    return decorated
-
 def roles_required(roles):
     def decorator(f):
         @wraps(f)
@@ -65,6 +93,11 @@ def roles_required(roles):
         return decorated_function
     return decorator
 
+def hashing_busy_response():
+    response = jsonify({'message': 'Server is busy, please try again shortly.'})
+    response.headers['Retry-After'] = '1'
+    return response, 503
+
 # --- Hapus Endpoint untuk Menyajikan Halaman HTML ---
 # @app.route('/')
 # def login_page():
@@ -92,6 +125,12 @@ def api_register():
     if not username or not password:
         return jsonify({'message': 'Username and password are required!'}), 400
 
+    # Hash dulu sebelum ambil koneksi, supaya koneksi pool tidak tertahan selama hashing
+    try:
+        password_hash = hashing_pool.hash(password)
+    except HashingPoolBusy:
+        return hashing_busy_response()
+
     connection = get_db_connection()
     if connection is None:
         return jsonify({'message': 'Database connection error!'}), 500
@@ -108,7 +147,7 @@ def api_register():
                 INSERT INTO users (username, password, role, address, phone_number)
                 VALUES (%s, %s, %s, %s, %s)
             """
-            cursor.execute(sql, (username, password, role, address, phone_number))
+            cursor.execute(sql, (username, password_hash, role, address, phone_number))
         connection.commit()
         return jsonify({'message': 'User registered successfully!', 'user': {'username': username, 'role': role}}), 201
     except Exception as e:
@@ -135,57 +174,86 @@ def api_login():
             sql = "SELECT id, username, password, role FROM users WHERE username = %s"
             cursor.execute(sql, (username,))
             user = cursor.fetchone()
-
-            if not user or user['password'] != password:
-                return jsonify({'message': 'Invalid credentials!'}), 401
-
-            token_payload = {
-                'user_id': user['username'],
-                'role': user['role'],
-                'exp': datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(minutes=30)
-            }
-            token = jwt.encode(token_payload, app.config['SECRET_KEY'], algorithm="HS256")
-
-            return jsonify({'token': token})
     except Exception as e:
         return jsonify({'message': f'Error during login: {e}'}), 500
     finally:
         connection.close()
 
-@app.route('/api/profile', methods=['GET'])
-@token_required
-def api_get_profile():
-    user_id_from_token = request.user_data['user_id']
-    
+    # Verifikasi di luar koneksi DB. User lama (password plaintext) atau hash dengan
+    # iterasi lama di-hash ulang otomatis setelah login berhasil.
+    try:
+        ok, new_hash = hashing_pool.check(password, user['password'] if user else None)
+    except HashingPoolBusy:
+        return hashing_busy_response()
+    if not ok:
+        return jsonify({'message': 'Invalid credentials!'}), 401
+
+    if new_hash:
+        connection = get_db_connection()
+        if connection is not None:
+            try:
+                with connection.cursor() as cursor:
+                    cursor.execute("UPDATE users SET password = %s WHERE id = %s", (new_hash, user['id']))
+                connection.commit()
+            except Exception as e:
+                # Login tetap berhasil; rehash dicoba lagi di login berikutnya
+                connection.rollback()
+                print(f"Warning: Failed to rehash password of {username}: {e}")
+            finally:
+                connection.close()
+
+    token_payload = {
+        'user_id': user['username'],
+        'role': user['role'],
+        'exp': datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(minutes=30)
+    }
+    token = jwt.encode(token_payload, app.config['SECRET_KEY'], algorithm="HS256")
+
+    return jsonify({'token': token})
+
+# Baca profil dari MySQL; None kalau user tidak ada (tidak di-cache)
+def load_profile(username):
     connection = get_db_connection()
     if connection is None:
-        return jsonify({'message': 'Database connection error!'}), 500
-    
+        raise ConnectionError('Database connection error!')
+
     try:
         with connection.cursor() as cursor:
             sql = """
                 SELECT username, role, address, phone_number
                 FROM users WHERE username = %s
             """
-            cursor.execute(sql, (user_id_from_token,))
+            cursor.execute(sql, (username,))
             user_data = cursor.fetchone()
-            
-            if not user_data:
-                return jsonify({'message': 'User profile not found!'}), 404
-            
-            profile_data = {
-                "username": user_data['username'],
-                "role": user_data['role'],
-                "email": f"{user_data['username']}@example.com",
-                "address": user_data['address'],
-                "phone_number": user_data['phone_number']
-            }
-            return jsonify({'profile': profile_data})
-    except Exception as e:
-        return jsonify({'message': f'Error fetching profile: {e}'}), 500
     finally:
         connection.close()
 
+    if not user_data:
+        return None
+    return {
+        "username": user_data['username'],
+        "role": user_data['role'],
+        "email": f"{user_data['username']}@example.com",
+        "address": user_data['address'],
+        "phone_number": user_data['phone_number']
+    }
+
+@app.route('/api/profile', methods=['GET'])
+@token_required
+def api_get_profile():
+    user_id_from_token = request.user_data['user_id']
+
+    try:
+        profile_data = profile_cache.get_or_load(user_id_from_token, load_profile)
+    except ConnectionError as e:
+        return jsonify({'message': str(e)}), 500
+    except Exception as e:
+        return jsonify({'message': f'Error fetching profile: {e}'}), 500
+
+    if profile_data is None:
+        return jsonify({'message': 'User profile not found!'}), 404
+    return jsonify({'profile': profile_data})
+
 @app.route('/api/profile/edit', methods=['PUT'])
 @token_required
 def api_edit_profile():
@@ -219,6 +287,7 @@ def api_edit_profile():
 
             cursor.execute(sql, tuple(update_values))
             connection.commit()
+            profile_cache.invalidate(user_id_from_token)
 
             if cursor.rowcount == 0:
                 return jsonify({'message': 'User not found or no changes applied!'}), 404
@@ -236,5 +305,27 @@ def api_edit_profile():
 def api_get_admin_data():
     return jsonify({'message': 'This is sensitive data for admins only!'})
 
+@app.route('/api/admin/pool_stats', methods=['GET'])
+@token_required
+@roles_required(['admin'])
+def api_get_pool_stats():
+    return jsonify(db_pool.stats())
+
+@app.route('/api/admin/profile_cache_stats', methods=['GET'])
+@token_required
+@roles_required(['admin'])
+def api_get_profile_cache_stats():
+    return jsonify(profile_cache.stats())
+
+@app.route('/api/admin/password_hashing_stats', methods=['GET'])
+@token_required
+@roles_required(['admin'])
+def api_get_password_hashing_stats():
+    return jsonify(hashing_pool.stats())
+
+def create_app():
+    return app
+
 if __name__ == '__main__':
-    app.run(debug=True, port=5001)
\ No newline at end of file
+    # Development server; production runs `gunicorn wsgi:application` (gunicorn.conf.py)
+    create_app().run(debug=True, port=PORT)
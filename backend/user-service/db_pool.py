@@ -0,0 +1,126 @@
+import threading
+import time
+from collections import deque
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+# Connection handed out by the pool. close() gives it back instead of closing the socket,
+# so code written against a plain pymysql connection keeps working unchanged.
+class PooledConnection:
+    def __init__(self, pool, connection, created_at):
+        self._pool = pool
+        self._connection = connection
+        self._created_at = created_at
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+    def close(self):
+        if self._connection is not None:
+            connection, self._connection = self._connection, None
+            self._pool.release(connection, self._created_at)
+
+
+# Bounded, thread-safe pool. Keeps up to pool_size idle connections and allows
+# max_overflow extra ones under load; callers wait up to timeout for a free slot.
+class ConnectionPool:
+    def __init__(self, creator, pool_size=5, max_overflow=10, timeout=5.0, max_lifetime=3600, ping=True):
+        self.creator = creator
+        self.pool_size = pool_size
+        self.max_overflow = max_overflow
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.ping = ping
+        self._idle = deque()  # (connection, created_at)
+        self._checked_out = 0
+        self._cond = threading.Condition()
+        self._counters = {'created': 0, 'reused': 0, 'discarded': 0, 'waits': 0, 'timeouts': 0}
+
+    def _expired(self, created_at):
+        return self.max_lifetime is not None and time.monotonic() - created_at >= self.max_lifetime
+
+    def _count(self, name):
+        with self._cond:
+            self._counters[name] += 1
+
+    def _discard(self, connection):
+        self._count('discarded')
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def _healthy(self, connection, created_at):
+        if self._expired(created_at):
+            return False
+        if not self.ping:
+            return True
+        try:
+            connection.ping(reconnect=False)
+            return True
+        except Exception:
+            return False
+
+    def acquire(self):
+        deadline = time.monotonic() + self.timeout
+        with self._cond:
+            while not self._idle and self._checked_out >= self.pool_size + self.max_overflow:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._counters['timeouts'] += 1
+                    raise PoolTimeout('Timed out waiting for a database connection')
+                self._counters['waits'] += 1
+                self._cond.wait(remaining)
+            # Reserve the slot now; the connection itself is checked or opened outside the lock
+            self._checked_out += 1
+            idle = self._idle.pop() if self._idle else None
+
+        try:
+            if idle is not None:
+                connection, created_at = idle
+                if self._healthy(connection, created_at):
+                    self._count('reused')
+                    return PooledConnection(self, connection, created_at)
+                self._discard(connection)
+            connection = self.creator()
+            self._count('created')
+            return PooledConnection(self, connection, time.monotonic())
+        except Exception:
+            with self._cond:
+                self._checked_out -= 1
+                self._cond.notify()
+            raise
+
+    def release(self, connection, created_at):
+        # Roll back so the next borrower never inherits an open transaction or stale snapshot
+        try:
+            connection.rollback()
+            reusable = not self._expired(created_at)
+        except Exception:
+            reusable = False
+
+        with self._cond:
+            self._checked_out -= 1
+            if reusable and len(self._idle) < self.pool_size:
+                self._idle.append((connection, created_at))
+                connection = None
+            self._cond.notify()
+        if connection is not None:
+            self._discard(connection)
+
+    def close(self):
+        with self._cond:
+            idle, self._idle = list(self._idle), deque()
+        for connection, _ in idle:
+            self._discard(connection)
+
+    def stats(self):
+        with self._cond:
+            return dict(self._counters,
+                        pool_size=self.pool_size,
+                        max_overflow=self.max_overflow,
+                        idle=len(self._idle),
+                        checked_out=self._checked_out)
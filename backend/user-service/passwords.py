@@ -0,0 +1,115 @@
+import base64
+import hashlib
+import hmac
+import secrets
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Password hashes in the "pbkdf2_sha256$<iterations>$<salt>$<hash>" format. Rows written
+# before hashing was introduced hold the plain password; they still verify and are
+# flagged for a rehash, as are hashes made with an older iteration count.
+
+ALGORITHM = 'pbkdf2_sha256'
+
+
+def _b64(raw):
+    return base64.b64encode(raw).decode().rstrip('=')
+
+
+def _pbkdf2(password, salt, iterations):
+    return hashlib.pbkdf2_hmac('sha256', password.encode(), salt.encode(), iterations)
+
+
+def hash_password(password, iterations):
+    salt = _b64(secrets.token_bytes(16))
+    return f'{ALGORITHM}${iterations}${salt}${_b64(_pbkdf2(password, salt, iterations))}'
+
+
+def is_hashed(stored):
+    return stored.startswith(ALGORITHM + '$')
+
+
+# Returns (ok, new_hash); new_hash is set when the stored value should be replaced
+def check_password(password, stored, iterations):
+    if not is_hashed(stored):
+        ok = hmac.compare_digest(password.encode(), stored.encode())
+        return ok, hash_password(password, iterations) if ok else None
+
+    try:
+        _, stored_iterations, salt, expected = stored.split('$')
+        stored_iterations = int(stored_iterations)
+    except ValueError:
+        return False, None
+    ok = hmac.compare_digest(_b64(_pbkdf2(password, salt, stored_iterations)), expected)
+    if ok and stored_iterations != iterations:
+        return ok, hash_password(password, iterations)
+    return ok, None
+
+
+class HashingPoolBusy(Exception):
+    pass
+
+
+# Bounded pool for the CPU-heavy hashing. hashlib releases the GIL while it hashes, so
+# threads run in parallel. `workers` hashes run at once and at most `max_in_flight`
+# register/login requests may be running or waiting for one; beyond that run() raises
+# HashingPoolBusy right away. Keep max_in_flight below the process's request threads and
+# workers at this process's share of the cores, so a login storm can neither tie up
+# every request thread nor oversubscribe the CPU.
+class HashingPool:
+    def __init__(self, iterations, workers=1, max_in_flight=1):
+        self.iterations = iterations
+        self.workers = max(1, workers)
+        self.max_in_flight = max(1, max_in_flight)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='password-hash')
+        self._slots = threading.BoundedSemaphore(self.max_in_flight)
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._counters = {'completed': 0, 'rejected': 0, 'rehashed': 0, 'hash_seconds': 0.0}
+
+    def run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._counters['rejected'] += 1
+            raise HashingPoolBusy('Too many password operations in progress')
+        with self._lock:
+            self._in_flight += 1
+        try:
+            return self._executor.submit(self._timed, fn, *args).result()
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+            self._slots.release()
+
+    def _timed(self, fn, *args):
+        started = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            with self._lock:
+                self._counters['completed'] += 1
+                self._counters['hash_seconds'] += time.perf_counter() - started
+
+    def hash(self, password):
+        return self.run(hash_password, password, self.iterations)
+
+    # stored=None (unknown user) still costs one hash, so response times don't reveal
+    # which usernames exist
+    def check(self, password, stored):
+        if stored is None:
+            self.run(hash_password, password, self.iterations)
+            return False, None
+        ok, new_hash = self.run(check_password, password, stored, self.iterations)
+        if new_hash:
+            with self._lock:
+                self._counters['rehashed'] += 1
+        return ok, new_hash
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters,
+                        iterations=self.iterations,
+                        workers=self.workers,
+                        max_in_flight=self.max_in_flight,
+                        in_flight=self._in_flight)
@@ -0,0 +1,147 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+
+
+# Read-through caches for profiles, keyed by username. get_or_load() only caches what
+# the loader found; a profile edited while it was being loaded is not cached, so an
+# invalidation can't be overwritten by the stale row read just before it.
+class ProfileCache:
+    def __init__(self, maxsize=10000, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._generation = 0  # bumped by every invalidation
+        self._data = OrderedDict()  # username -> (expires_at, profile)
+        self._lock = threading.Lock()
+
+    def get_or_load(self, username, loader):
+        with self._lock:
+            entry = self._data.get(username)
+            if entry is not None and entry[0] > time.monotonic():
+                self._data.move_to_end(username)
+                self.hits += 1
+                return entry[1]
+            self._data.pop(username, None)
+            self.misses += 1
+            generation = self._generation
+
+        profile = loader(username)
+        if profile is not None:
+            with self._lock:
+                if generation == self._generation:
+                    self._data[username] = (time.monotonic() + self.ttl, profile)
+                    self._data.move_to_end(username)
+                    while len(self._data) > self.maxsize:
+                        self._data.popitem(last=False)
+                        self.evictions += 1
+        return profile
+
+    def invalidate(self, username):
+        with self._lock:
+            self._generation += 1
+            self._data.pop(username, None)
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'backend': 'memory',
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / total, 4) if total else 0.0
+            }
+
+
+# Shared cache for multi-worker deployments, so an edit handled by one worker
+# invalidates the profile for all of them. Needs the redis package. Cache errors
+# fall back to the loader; the TTL bounds how stale a missed invalidation can get.
+# Like ProfileCache's generation, a per-user version key is bumped by every
+# invalidation and a loaded row is only written back if the version is unchanged,
+# checked atomically by a Lua script.
+class RedisProfileCache:
+    SET_IF_VERSION = """
+        if (redis.call('GET', KEYS[2]) or '0') == ARGV[1] then
+            redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+        end
+    """
+
+    def __init__(self, url, ttl=300, prefix='profile:', version_prefix='profile-version:', version_ttl=86400):
+        import redis
+        self.ttl = ttl
+        self.prefix = prefix
+        self.version_prefix = version_prefix
+        self.version_ttl = version_ttl  # far longer than any load, so an expiring version can't match a stale read
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self._errors = redis.RedisError
+        self._client = redis.Redis.from_url(url, socket_timeout=0.2, socket_connect_timeout=0.2)
+        self._set_if_version = self._client.register_script(self.SET_IF_VERSION)
+        self._lock = threading.Lock()
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def get_or_load(self, username, loader):
+        key = self.prefix + username
+        version_key = self.version_prefix + username
+        try:
+            cached, version = self._client.mget(key, version_key)
+            cacheable = True
+        except self._errors:
+            self._count('errors')
+            cached, version, cacheable = None, None, False
+        if cached is not None:
+            self._count('hits')
+            return json.loads(cached)
+
+        self._count('misses')
+        profile = loader(username)
+        if profile is not None and cacheable:
+            try:
+                self._set_if_version(keys=[key, version_key],
+                                     args=[version.decode() if version else '0', json.dumps(profile), self.ttl])
+            except self._errors:
+                self._count('errors')
+        return profile
+
+    def invalidate(self, username):
+        version_key = self.version_prefix + username
+        try:
+            pipe = self._client.pipeline()
+            pipe.incr(version_key)
+            pipe.expire(version_key, self.version_ttl)
+            pipe.delete(self.prefix + username)
+            pipe.execute()
+        except self._errors:
+            self._count('errors')
+            print(f"Warning: Failed to invalidate cached profile of {username}")
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'backend': 'redis',
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'errors': self.errors,
+                'hit_rate': round(self.hits / total, 4) if total else 0.0
+            }
+
+
+# PROFILE_CACHE_URL (e.g. redis://cache:6379/0) selects the shared cache,
+# otherwise each process keeps its own LRU
+def make_profile_cache(url=None, maxsize=10000, ttl=300):
+    if url:
+        return RedisProfileCache(url, ttl=ttl)
+    return ProfileCache(maxsize=maxsize, ttl=ttl)
@@ -0,0 +1,137 @@
+import threading
+
+import pytest
+
+import db_pool
+from db_pool import ConnectionPool, PoolTimeout
+
+
+# Stands in for a pymysql connection; records what the pool does with it
+class FakeConnection:
+    def __init__(self, number):
+        self.number = number
+        self.alive = True
+        self.broken = False
+        self.closed = False
+        self.rollbacks = 0
+
+    def ping(self, reconnect=True):
+        if not self.alive:
+            raise ConnectionError('server has gone away')
+
+    def rollback(self):
+        if self.broken:
+            raise ConnectionError('lost connection')
+        self.rollbacks += 1
+
+    def close(self):
+        self.closed = True
+
+
+class FakeFactory:
+    def __init__(self):
+        self.created = []
+
+    def __call__(self):
+        connection = FakeConnection(len(self.created) + 1)
+        self.created.append(connection)
+        return connection
+
+
+class FakeClock:
+    now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def factory():
+    return FakeFactory()
+
+
+def test_pool_is_bounded_by_pool_size_plus_overflow(factory):
+    pool = ConnectionPool(factory, pool_size=2, max_overflow=1, timeout=0.05)
+    held = [pool.acquire() for _ in range(3)]
+
+    with pytest.raises(PoolTimeout):
+        pool.acquire()
+
+    assert len(factory.created) == 3
+    assert pool.stats()['timeouts'] == 1
+    assert pool.stats()['checked_out'] == 3
+    for connection in held:
+        connection.close()
+    # Only pool_size connections are kept idle; the overflow one is closed
+    assert pool.stats()['idle'] == 2
+    assert [c.closed for c in factory.created].count(True) == 1
+
+
+def test_waiting_borrower_gets_the_released_connection(factory):
+    pool = ConnectionPool(factory, pool_size=1, max_overflow=0, timeout=2)
+    first = pool.acquire()
+    borrowed = []
+    waiter = threading.Thread(target=lambda: borrowed.append(pool.acquire()))
+    waiter.start()
+
+    first.close()
+    waiter.join()
+
+    assert borrowed[0].number == 1
+    assert len(factory.created) == 1
+    assert pool.stats()['waits'] >= 1
+
+
+def test_dead_connection_is_discarded_on_borrow(factory):
+    pool = ConnectionPool(factory, pool_size=1, max_overflow=0)
+    pool.acquire().close()
+    factory.created[0].alive = False
+
+    connection = pool.acquire()
+
+    assert connection.number == 2
+    assert factory.created[0].closed
+    assert pool.stats()['discarded'] == 1
+
+
+def test_connection_past_max_lifetime_is_replaced(factory, monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(db_pool, 'time', clock)
+    pool = ConnectionPool(factory, pool_size=1, max_overflow=0, max_lifetime=60)
+    pool.acquire().close()
+
+    clock.now += 30
+    young = pool.acquire()
+    assert young.number == 1
+    young.close()
+
+    clock.now += 31
+    connection = pool.acquire()
+
+    assert connection.number == 2
+    assert factory.created[0].closed
+    assert pool.stats()['discarded'] == 1
+
+
+def test_release_rolls_back_the_connection(factory):
+    pool = ConnectionPool(factory, pool_size=1, max_overflow=0)
+    connection = pool.acquire()
+
+    connection.close()
+    connection.close()
+
+    assert factory.created[0].rollbacks == 1
+    assert pool.stats()['idle'] == 1
+    assert pool.stats()['checked_out'] == 0
+
+
+def test_connection_that_fails_to_roll_back_is_not_reused(factory):
+    pool = ConnectionPool(factory, pool_size=1, max_overflow=0)
+    connection = pool.acquire()
+    factory.created[0].broken = True
+
+    connection.close()
+
+    assert factory.created[0].closed
+    assert pool.stats()['idle'] == 0
+    assert pool.acquire().number == 2